@@ -0,0 +1,381 @@
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+import workload
+from driver import parse_trace, get_dispatch_table
+from output_sink import SilentOutputSink, CountingOutputSink
+from site_manager import SiteManager
+from transaction_manager import TransactionManager
+from metrics import Metrics
+from wal import WriteAheadLog
+from read_routing import READ_ROUTING_POLICIES, create_read_routing
+
+
+def allocated(fn):
+    '''Returns the result of fn and the number of bytes it left allocated'''
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (result, after - before)
+
+def memory_benchmark(num_site, num_var, num_lock):
+    '''Measures the memory used per variable and per active lock
+
+    Parameters:
+        num_site(int): number of sites
+        num_var(int): number of variables
+        num_lock(int): number of read locks to acquire
+    Returns:
+        dict: dictionary of measure name and bytes
+    '''
+    site_manager, manager_bytes = allocated(lambda: SiteManager(num_site, num_var, SilentOutputSink()))
+    sites = list(site_manager.sites.values())
+    replicas = sum(len(site.variables) for site in sites)
+
+    def materialize():
+        for site in sites:
+            for variable in site.variables.values():
+                pass
+    _, variable_bytes = allocated(materialize)
+
+    var_names = list(site_manager.placement)
+    grants = [(site_manager.sites[site_manager.placement[var_names[i % len(var_names)]][0]],
+        'T'+str(i), var_names[i % len(var_names)]) for i in range(num_lock)]
+    def lock():
+        for site, t_id, var_name in grants:
+            site.acquire_read_lock(t_id, var_name)
+    _, lock_bytes = allocated(lock)
+    return {
+        'bytes per variable replica at startup': manager_bytes / replicas,
+        'bytes per materialized variable': variable_bytes / replicas,
+        'bytes per active lock': lock_bytes / num_lock,
+    }
+
+def percentile(samples, fraction):
+    '''Returns the sample at the given fraction of the sorted samples'''
+    return samples[int(fraction * (len(samples) - 1))]
+
+def throughput_benchmark(generator, replication_factor=None, closed_loop=True, trace=None, metrics=None, wal=None,
+        site_processes=False, read_routing=None, deadlock_prevention=None, optimistic=False):
+    '''Runs a synthetic workload in-process and measures throughput and latency
+
+    Parameters:
+        generator(WorkloadGenerator): the workload
+        replication_factor(int): number of sites holding each variable, None for the default placement
+        closed_loop(bool): if True blocked transactions issue no operations until they are granted
+        trace(file): if given, the operations run are written to it in the input grammar
+        metrics(Metrics): metrics to record, or None to record nothing
+        wal(WriteAheadLog): settings of the write-ahead logs of the sites, None to keep the data only in memory
+        site_processes(bool): True to run each site in its own worker process
+        read_routing(ReadRouting): policy choosing the replica of each read, None for the first live one
+        deadlock_prevention(string): 'wait-die' or 'wound-wait', None to detect deadlocks on the wait-for graph
+        optimistic(bool): True to run the read-write transactions optimistically, validated when they end
+    Returns:
+        dict: dictionary of measure name and value
+    '''
+    output = CountingOutputSink()
+    transaction_manager = TransactionManager(output, generator.num_site, len(generator.var_names),
+        replication_factor, metrics, wal, site_processes=site_processes, read_routing=read_routing,
+        deadlock_prevention=deadlock_prevention, optimistic=optimistic)
+    dispatch = get_dispatch_table(transaction_manager)
+    transaction_map = transaction_manager.transaction_map
+    def status(t_id):
+        transaction = transaction_map.get(t_id)
+        return transaction.status if transaction is not None else None
+    latencies = {} # dict of command and list of latencies in ns
+    clock = time.perf_counter_ns
+    lines = generator.generate(status if closed_loop else None)
+    total = 0
+    for line, op_time, command, args in parse_trace(lines):
+        if trace is not None:
+            trace.write(line + '\n')
+        method, timed = dispatch[command]
+        start = clock()
+        if timed:
+            method(*args, op_time)
+        else:
+            method(*args)
+        elapsed = clock() - start
+        total += elapsed
+        latencies.setdefault(command, []).append(elapsed)
+    transaction_manager.close()
+    counts = output.counts
+    ended = counts['commit'] + counts['abort']
+    results = {
+        'operations': sum(len(samples) for samples in latencies.values()),
+        'ops/sec': sum(len(samples) for samples in latencies.values()) / (total / 1e9),
+        'commits': counts['commit'],
+        'commits/sec': counts['commit'] / (total / 1e9),
+        'aborts': counts['abort'],
+        'commit %': 100 * counts['commit'] / ended if ended else 0.0,
+        'deadlocks': counts['deadlock'],
+        'prevented': counts['prevention'],
+        'invalidated': counts['validation'],
+        'blocked': counts['blocked'],
+    }
+    samples = sorted(sample for command_samples in latencies.values() for sample in command_samples)
+    results['p50 us'] = percentile(samples, 0.5) / 1e3
+    results['p99 us'] = percentile(samples, 0.99) / 1e3
+    for command in sorted(latencies):
+        command_samples = sorted(latencies[command])
+        results[command + ' p50 us'] = percentile(command_samples, 0.5) / 1e3
+        results[command + ' p99 us'] = percentile(command_samples, 0.99) / 1e3
+    return results
+
+def wal_benchmark(generator, group_sizes, checkpoint_every):
+    '''Measures the commit throughput with the write-ahead logs fsynced after each commit or in groups
+
+    Parameters:
+        generator(WorkloadGenerator): the workload
+        group_sizes(list): numbers of commits per fsync to compare
+        checkpoint_every(int): number of commits at a site between two checkpoints
+    Returns:
+        dict: dictionary of measure name and value
+    '''
+    results = {'in memory commits/sec': throughput_benchmark(generator)['commits/sec']}
+    for group_commit in group_sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            wal = WriteAheadLog(directory, group_commit, checkpoint_every)
+            measures = throughput_benchmark(generator, wal=wal)
+        results[f'group commit {group_commit} commits/sec'] = measures['commits/sec']
+    return results
+
+def end_group_benchmark(num_transactions, group_size, num_site=10):
+    '''Measures the commit throughput of transactions ended together with end_group, logged with fsync per group
+
+    Parameters:
+        num_transactions(int): number of transactions, each writing its own replicated variable
+        group_size(int): number of transactions ended by each call of end_group
+        num_site(int): number of sites
+    Returns:
+        float: commits per second
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        output = CountingOutputSink()
+        transaction_manager = TransactionManager(output, num_site, 2 * group_size, wal=WriteAheadLog(directory))
+        time_now = 0
+        start = time.perf_counter()
+        for first in range(0, num_transactions, group_size):
+            t_ids = ['T'+str(i) for i in range(first, min(first + group_size, num_transactions))]
+            for k, t_id in enumerate(t_ids):
+                time_now += 1
+                transaction_manager.begin(t_id, time_now)
+                time_now += 1
+                transaction_manager.write(t_id, 'x'+str(2*(k+1)), k, time_now)
+            time_now += 1
+            transaction_manager.end_group(t_ids, time_now)
+        elapsed = time.perf_counter() - start
+        transaction_manager.close()
+    return output.counts['commit'] / elapsed
+
+def snapshot_benchmark(num_var, num_site=10, versions=4, scans=10):
+    '''Measures read-only scans of every variable, read one by one and with read_snapshot
+
+    Parameters:
+        num_var(int): number of variables
+        num_site(int): number of sites
+        versions(int): number of versions committed for each variable while the scans are open
+        scans(int): number of scans of a read-only transaction after the first
+    Returns:
+        dict: dictionary of measure name and value
+    '''
+    output = CountingOutputSink()
+    transaction_manager = TransactionManager(output, num_site, num_var)
+    var_names = ['x'+str(j) for j in range(1, num_var+1)]
+    time_now = 1
+    transaction_manager.beginRO('T0', time_now) # keeps every version below alive
+    for version in range(versions):
+        time_now += 1
+        transaction_manager.begin('W'+str(version), time_now)
+        for var in var_names:
+            transaction_manager.write('W'+str(version), var, version, time_now)
+        transaction_manager.end('W'+str(version), time_now)
+        time_now += 1
+        transaction_manager.beginRO('R'+str(version), time_now)
+    time_now += 1
+    def scan(t_id):
+        start = time.perf_counter()
+        for var in var_names:
+            transaction_manager.read(t_id, var, time_now)
+        return num_var / (time.perf_counter() - start)
+    def bulk(t_id):
+        start = time.perf_counter()
+        transaction_manager.read_snapshot(t_id, var_names, time_now)
+        return num_var / (time.perf_counter() - start)
+    results = {'first scan reads/sec': scan('R0')}
+    results['cached scan reads/sec'] = sum(scan('R0') for _ in range(scans)) / scans
+    results['first read_snapshot reads/sec'] = bulk('R1')
+    results['cached read_snapshot reads/sec'] = sum(bulk('R1') for _ in range(scans)) / scans
+    transaction_manager.close()
+    return results
+
+def routing_benchmark(generator, policies, replication_factor=None):
+    '''Runs the same workload with each read routing policy and measures where the reads take their locks
+
+    Parameters:
+        generator(WorkloadGenerator): the workload, with site failures to measure the aborts they cause
+        policies(list): names of the read routing policies to compare
+        replication_factor(int): number of sites holding each variable, None for the default placement
+    Returns:
+        dict: dictionary of measure name and value, for each policy
+    '''
+    results = {}
+    for name in policies:
+        metrics = Metrics()
+        measures = throughput_benchmark(generator, replication_factor, metrics=metrics,
+            read_routing=create_read_routing(name, generator.seed))
+        read_locks = [value for (metric, labels), value in metrics.counters.items() if metric == 'read_locks_total']
+        fanout = metrics.histograms.get(('commit_fanout', ()))
+        results[f'{name} ops/sec'] = measures['ops/sec']
+        results[f'{name} hottest site read lock %'] = 100 * max(read_locks) / sum(read_locks) if read_locks else 0.0
+        results[f'{name} sites per commit'] = fanout.sum / fanout.count if fanout is not None else 0.0
+        results[f'{name} commit %'] = measures['commit %']
+        results[f'{name} failed site aborts'] = metrics.value('aborts_total', (('reason', 'failed_site'),))
+        results[f'{name} deadlocks'] = measures['deadlocks']
+    return results
+
+def deadlock_benchmark(generator, replication_factor=None):
+    '''Runs the same workload with deadlock detection and with wait-die and wound-wait prevention
+
+    Parameters:
+        generator(WorkloadGenerator): the workload
+        replication_factor(int): number of sites holding each variable, None for the default placement
+    Returns:
+        dict: dictionary of measure name and value, for each way of handling deadlocks
+    '''
+    results = {}
+    for name, deadlock_prevention in (('detect', None), ('wait-die', 'wait-die'), ('wound-wait', 'wound-wait')):
+        metrics = Metrics()
+        measures = throughput_benchmark(generator, replication_factor, metrics=metrics,
+            deadlock_prevention=deadlock_prevention)
+        checks = metrics.histograms.get(('deadlock_check_seconds', ()))
+        results[f'{name} ops/sec'] = measures['ops/sec']
+        results[f'{name} commits/sec'] = measures['commits/sec']
+        results[f'{name} commit %'] = measures['commit %']
+        results[f'{name} deadlock aborts'] = measures['deadlocks'] + measures['prevented']
+        results[f'{name} blocked'] = measures['blocked']
+        results[f'{name} cycle search ms'] = checks.sum * 1e3 if checks is not None else 0.0
+        results[f'{name} p50 us'] = measures['p50 us']
+        results[f'{name} p99 us'] = measures['p99 us']
+    return results
+
+def occ_benchmark(generators, replication_factor=None):
+    '''Runs workloads of increasing contention with strict two phase locking and optimistically, to find
+    the contention above which locking commits more transactions per second
+
+    Parameters:
+        generators(list): list of Zipfian skew and the WorkloadGenerator with that skew, by increasing skew
+        replication_factor(int): number of sites holding each variable, None for the default placement
+    Returns:
+        dict: dictionary of measure name and value, for each skew, and the crossover skew
+    '''
+    results = {}
+    crossover = None
+    for skew, generator in generators:
+        locking = throughput_benchmark(generator, replication_factor)
+        optimistic = throughput_benchmark(generator, replication_factor, optimistic=True)
+        results[f'skew {skew} 2PL commits/sec'] = locking['commits/sec']
+        results[f'skew {skew} OCC commits/sec'] = optimistic['commits/sec']
+        results[f'skew {skew} 2PL commit %'] = locking['commit %']
+        results[f'skew {skew} OCC commit %'] = optimistic['commit %']
+        results[f'skew {skew} 2PL p99 us'] = locking['p99 us']
+        results[f'skew {skew} OCC p99 us'] = optimistic['p99 us']
+        if crossover is None and locking['commits/sec'] > optimistic['commits/sec']:
+            crossover = skew
+    results['crossover skew'] = crossover if crossover is not None else float('nan')
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the transaction engine')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    memory = subparsers.add_parser('memory', help='memory per variable and per active lock')
+    memory.add_argument('--sites', type=int, default=10)
+    memory.add_argument('--variables', type=int, default=20000)
+    memory.add_argument('--locks', type=int, default=100000)
+    throughput = subparsers.add_parser('throughput', help='ops/sec, aborts, deadlocks and latency of a synthetic workload')
+    workload.add_arguments(throughput)
+    throughput.add_argument('--replication', type=int, default=None,
+        help='number of sites holding each variable, placed by consistent hashing')
+    throughput.add_argument('--open-loop', action='store_true',
+        help='blocked transactions keep issuing operations, as a replayed trace does')
+    throughput.add_argument('--trace', type=argparse.FileType('w'), default=None,
+        help='also write the operations run to this file, for driver.py')
+    throughput.add_argument('--metrics', default=None, help='record metrics of the engine and write them to this file')
+    throughput.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json')
+    throughput.add_argument('--site-processes', action='store_true',
+        help='run each site in its own worker process, to measure the cost of messaging the replicas')
+    wal = subparsers.add_parser('wal', help='commit throughput with fsync after each commit or in groups')
+    workload.add_arguments(wal)
+    wal.add_argument('--group-commit', type=int, nargs='+', default=[1, 8, 64],
+        help='numbers of commits per fsync to compare')
+    wal.add_argument('--end-group', type=int, nargs='+', default=[1, 8],
+        help='numbers of transactions ended together by end_group to compare')
+    wal.add_argument('--checkpoint-every', type=int, default=1000)
+    snapshot = subparsers.add_parser('snapshot', help='read-only scans, read one by one and with read_snapshot')
+    snapshot.add_argument('--sites', type=int, default=10)
+    snapshot.add_argument('--variables', type=int, default=20000)
+    snapshot.add_argument('--versions', type=int, default=4,
+        help='number of versions of each variable kept for the read-only transactions')
+    snapshot.add_argument('--scans', type=int, default=10)
+    deadlock = subparsers.add_parser('deadlock',
+        help='throughput, aborts and tail latency with deadlock detection, wait-die and wound-wait')
+    workload.add_arguments(deadlock)
+    deadlock.set_defaults(concurrency=16, skew=1.0)
+    deadlock.add_argument('--replication', type=int, default=None,
+        help='number of sites holding each variable, placed by consistent hashing')
+    occ = subparsers.add_parser('occ',
+        help='commits/sec of strict two phase locking and optimistic concurrency control as contention grows')
+    workload.add_arguments(occ)
+    occ.set_defaults(read_ratio=0.9)
+    occ.add_argument('--skews', type=float, nargs='+', default=[0.0, 0.5, 1.0, 1.5, 2.0],
+        help='Zipfian skews of the variable choice to compare, replacing --skew')
+    occ.add_argument('--replication', type=int, default=None,
+        help='number of sites holding each variable, placed by consistent hashing')
+    routing = subparsers.add_parser('routing',
+        help='read lock hotspots, commit fan-out and aborts after failures of each read routing policy')
+    workload.add_arguments(routing)
+    routing.set_defaults(fail_rate=0.01)
+    routing.add_argument('--replication', type=int, default=None,
+        help='number of sites holding each variable, placed by consistent hashing')
+    routing.add_argument('--policies', nargs='+', choices=READ_ROUTING_POLICIES, default=list(READ_ROUTING_POLICIES))
+    options = parser.parse_args()
+    if options.benchmark == 'memory':
+        results = memory_benchmark(options.sites, options.variables, options.locks)
+    elif options.benchmark == 'throughput':
+        metrics = Metrics() if options.metrics is not None else None
+        results = throughput_benchmark(workload.from_arguments(options), options.replication,
+            not options.open_loop, options.trace, metrics, site_processes=options.site_processes)
+        if options.trace is not None:
+            options.trace.close()
+        if metrics is not None:
+            metrics.write(options.metrics, options.metrics_format)
+    elif options.benchmark == 'deadlock':
+        results = deadlock_benchmark(workload.from_arguments(options), options.replication)
+    elif options.benchmark == 'occ':
+        generators = []
+        for skew in options.skews:
+            options.skew = skew
+            generators.append((skew, workload.from_arguments(options)))
+        results = occ_benchmark(generators, options.replication)
+    elif options.benchmark == 'routing':
+        results = routing_benchmark(workload.from_arguments(options), options.policies, options.replication)
+    elif options.benchmark == 'snapshot':
+        results = snapshot_benchmark(options.variables, options.sites, options.versions, options.scans)
+    elif options.benchmark == 'wal':
+        results = wal_benchmark(workload.from_arguments(options), options.group_commit, options.checkpoint_every)
+        for group_size in options.end_group:
+            results[f'end_group of {group_size} commits/sec'] = end_group_benchmark(options.transactions, group_size)
+    for name, value in results.items():
+        if isinstance(value, int):
+            print(f'{name}: {value}')
+        else:
+            print(f'{name}: {value:.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import workload
+from benchmark import percentile
+from server import DEFAULT_PORT
+
+
+class Client:
+    '''Session of a client of server.py, with one request in flight at a time'''
+    def __init__(self, reader, writer):
+        '''creates and initialises a new session over a connected stream
+
+        Parameters:
+            self(Client): instance of the class
+            reader(StreamReader): stream the replies are read from
+            writer(StreamWriter): stream the requests are written to
+        Returns:
+            Client: a new session
+        '''
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT):
+        '''Returns a session connected to the Unix socket socket_path, or to host and port'''
+        if socket_path is not None:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, line):
+        '''Sends the command line and returns its reply, once the server granted it
+
+        Parameters:
+            self(Client): instance of the class
+            line(string): a command of the input grammar
+        Returns:
+            dict: the reply, with the time of the request, the status of its transaction
+            and the names and text of the events it caused
+        '''
+        self.writer.write((line + '\n').encode())
+        await self.writer.drain()
+        reply = await self.reader.readline()
+        if not reply:
+            raise ConnectionError('the server closed the session')
+        return json.loads(reply)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def run_session(client, generator, rng, t_ids, latencies, counts):
+    '''Runs transactions of the workload one after the other until t_ids is exhausted
+
+    Parameters:
+        client(Client): the session
+        generator(WorkloadGenerator): the workload
+        rng(Random): random number generator of the session
+        t_ids(iterator): ids of the transactions left to run, shared by the sessions
+        latencies(dict): dictionary of command and list of latencies in ns, updated
+        counts(dict): dictionary of event name and number of times it was seen, updated
+    '''
+    clock = time.perf_counter_ns
+    for t_id in t_ids:
+        for line in generator.transaction(rng, t_id):
+            start = clock()
+            reply = await client.request(line)
+            latencies.setdefault(line[:line.index('(')], []).append(clock() - start)
+            for event in reply['events']:
+                counts[event] = counts.get(event, 0) + 1
+            if reply['status'] == 'ENDED':
+                break # committed, or aborted by a deadlock
+
+async def load(generator, sessions, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT, prefix='T'):
+    '''Runs a synthetic workload against the server from concurrent sessions and measures it
+
+    Parameters:
+        generator(WorkloadGenerator): the workload, of which the transaction count, read ratio, read-only
+            fraction, skew, length and seed are used
+        sessions(int): number of concurrent sessions, each running one transaction at a time
+        socket_path(string): Unix socket of the server, None to use host and port
+        host(string): TCP address of the server
+        port(int): TCP port of the server
+        prefix(string): prefix of the transaction ids, to tell apart concurrent load runs
+    Returns:
+        dict: dictionary of measure name and value
+    '''
+    clients = [await Client.connect(socket_path, host, port) for _ in range(sessions)]
+    t_ids = iter([prefix + str(i) for i in range(1, generator.num_transactions+1)])
+    latencies = {} # dict of command and list of latencies in ns
+    counts = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(client, generator, random.Random(generator.seed * sessions + i),
+        t_ids, latencies, counts) for i, client in enumerate(clients)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    commits = counts.get('commit', 0)
+    aborts = counts.get('abort', 0)
+    operations = sum(len(samples) for samples in latencies.values())
+    results = {
+        'operations': operations,
+        'ops/sec': operations / elapsed,
+        'commits': commits,
+        'commits/sec': commits / elapsed,
+        'aborts': aborts,
+        'commit %': 100 * commits / (commits + aborts) if commits + aborts else 0.0,
+        'deadlocks': counts.get('deadlock', 0),
+        'prevented': counts.get('prevention', 0),
+        'invalidated': counts.get('validation', 0),
+        'blocked': counts.get('blocked', 0),
+    }
+    samples = sorted(sample for command_samples in latencies.values() for sample in command_samples)
+    results['p50 us'] = percentile(samples, 0.5) / 1e3
+    results['p99 us'] = percentile(samples, 0.99) / 1e3
+    for command in sorted(latencies):
+        command_samples = sorted(latencies[command])
+        results[command + ' p50 us'] = percentile(command_samples, 0.5) / 1e3
+        results[command + ' p99 us'] = percentile(command_samples, 0.99) / 1e3
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the throughput and latency of server.py from concurrent sessions')
+    workload.add_arguments(parser)
+    parser.add_argument('--sessions', type=int, default=None,
+        help='number of concurrent sessions, the workload concurrency if omitted')
+    parser.add_argument('--socket', default=None, help='Unix socket of the server instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP address of the server')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port of the server')
+    parser.add_argument('--prefix', default='T', help='prefix of the transaction ids')
+    options = parser.parse_args()
+    generator = workload.from_arguments(options)
+    sessions = options.sessions if options.sessions is not None else generator.concurrency
+    results = asyncio.run(load(generator, sessions, options.socket, options.host, options.port, options.prefix))
+    for name, value in results.items():
+        if isinstance(value, int):
+            print(f'{name}: {value}')
+        else:
+            print(f'{name}: {value:.1f}')
+
+if __name__ == '__main__':
+    main()
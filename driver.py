@@ -1,76 +1,194 @@
-import fileinput
+import argparse
 import sys
-from status import Status
-from variable import Variable
-from lock import Lock
-from lock_type import LockType
-from site_manager import Site, SiteManager
-from collections import defaultdict
 from transaction_manager import TransactionManager
+from output_sink import OutputSink, BufferedOutputSink, SilentOutputSink
+from metrics import Metrics
+from wal import WriteAheadLog
+from read_routing import READ_ROUTING_POLICIES, create_read_routing
+
+# number of arguments taken by each command
+COMMANDS = {
+    'begin': 1,
+    'beginRO': 1,
+    'R': 2,
+    'W': 3,
+    'end': 1,
+    'fail': 1,
+    'recover': 1,
+    'dump': 0,
+}
+
+def parse_line(line):
+    '''Parses a single command line
+
+    Parameters:
+        line(string): single line of the input, without the trailing newline
+    Returns:
+        tuple: a tuple of the command and a tuple of its args. Transaction, variable and site ids
+        are interned and the value written by W is an int
+    '''
+    command, _, rest = line.partition('(')
+    arity = COMMANDS.get(command)
+    if not arity:
+        return (command, ())
+    args = rest[:rest.index(')')].split(',', arity - 1)
+    if arity == 3:
+        t_id, var, val = args
+        val = val.strip()
+        try:
+            val = int(val)
+        except ValueError:
+            pass
+        return (command, (sys.intern(t_id.strip()), sys.intern(var.strip()), val))
+    return (command, tuple(sys.intern(arg.strip()) for arg in args))
+
+def parse_trace(lines):
+    '''Streams parsed operations out of the input lines, skipping comments
+
+    Parameters:
+        lines(iterable): lines of the input
+    Returns:
+        generator: tuples of the raw line, its time, the command and a tuple of its args
+    '''
+    time = 0
+    for line in lines:
+        if line.startswith('//'):
+            continue
+        time += 1
+        line = line.rstrip('\n')
+        command, args = parse_line(line)
+        yield (line, time, command, args)
+
+def get_dispatch_table(transaction_manager):
+    '''Maps each command to the TransactionManager method that runs it
+
+    Parameters:
+        transaction_manager(TransactionManager): the transaction manager
+    Returns:
+        dict: dictionary of command and a tuple of the method and whether it takes the time
+    '''
+    return {
+        'begin': (transaction_manager.begin, True),
+        'beginRO': (transaction_manager.beginRO, True),
+        'R': (transaction_manager.read, True),
+        'W': (transaction_manager.write, True),
+        'end': (transaction_manager.end, True),
+        'fail': (transaction_manager.fail, True),
+        'recover': (transaction_manager.recover, True),
+        'dump': (transaction_manager.dump, False),
+    }
+
+def add_engine_arguments(parser):
+    '''Adds the options of the topology, metrics and durability of the engine to parser'''
+    parser.add_argument('--sites', type=int, default=10, help='number of sites')
+    parser.add_argument('--variables', type=int, default=20, help='number of variables')
+    parser.add_argument('--replication', type=int, default=None,
+        help='place each variable on this many sites by consistent hashing')
+    parser.add_argument('--metrics', default=None,
+        help='record metrics of the engine and write them to this file at the end of the run')
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+        help='write the metrics as a JSON snapshot or in the Prometheus text format')
+    parser.add_argument('--wal-dir', default=None,
+        help='keep a write-ahead log per site in this directory and start from the state it holds')
+    parser.add_argument('--group-commit', type=int, default=1,
+        help='number of commits written to a site log before it is fsynced')
+    parser.add_argument('--checkpoint-every', type=int, default=1000,
+        help='number of commits at a site between two checkpoints of its log')
+    parser.add_argument('--store-dir', default=None,
+        help='keep the committed values of each site in a memory-mapped file in this directory')
+    parser.add_argument('--site-processes', action='store_true',
+        help='run each site in its own worker process, called over a pipe')
+    parser.add_argument('--catch-up', type=int, default=None, metavar='BATCH',
+        help='copy the replicated variables of recovered sites from live replicas, checking BATCH of them per operation')
+    parser.add_argument('--read-routing', choices=READ_ROUTING_POLICIES, default='first',
+        help='policy choosing the replica each read goes to, the first live one in placement order by default')
+    parser.add_argument('--deadlock', choices=['detect', 'wait-die', 'wound-wait'], default='detect',
+        help='detect deadlocks on the wait-for graph, or prevent them by the start times of the transactions')
+    parser.add_argument('--optimistic', action='store_true',
+        help='run read-write transactions without locks, reading their snapshot and validated when they end')
+
+def engine_from_arguments(options, output, metrics=None):
+    '''Returns the TransactionManager described by the options added by add_engine_arguments
+
+    Parameters:
+        options(Namespace): the parsed options
+        output(OutputSink): sink for the output messages
+        metrics(Metrics): metrics to record, or None to record nothing
+    Returns:
+        TransactionManager: the transaction manager
+    '''
+    wal = None
+    if options.wal_dir is not None:
+        wal = WriteAheadLog(options.wal_dir, options.group_commit, options.checkpoint_every)
+    return TransactionManager(output, options.sites, options.variables, options.replication,
+        metrics, wal, options.store_dir, options.site_processes, options.catch_up,
+        create_read_routing(options.read_routing), None if options.deadlock == 'detect' else options.deadlock,
+        options.optimistic)
+
 
 class Driver:
 
     def __init__(self):
         self.main()
 
-    def parse_input(self, line):
-        '''Parses the input line
+    def main(self):
+        '''Starting point of the application'''
+        parser = argparse.ArgumentParser(description='Replicated concurrency control and recovery')
+        parser.add_argument('input_file', nargs='?', default='-',
+            help='input file, reads standard input if omitted or -')
+        parser.add_argument('--no-echo', dest='echo', action='store_false',
+            help='do not print each input line before its output')
+        parser.add_argument('--output', choices=['print', 'buffered', 'silent'], default='print',
+            help='print each message, write them to stdout in batches, or discard them')
+        parser.add_argument('--flush-every', type=int, default=1024,
+            help='number of messages per batch with --output buffered, 0 to flush only on dump')
+        add_engine_arguments(parser)
+        options = parser.parse_args()
+        if options.output == 'buffered':
+            sys.stdout.flush()
+            output = BufferedOutputSink(sys.stdout.fileno(), options.flush_every)
+        elif options.output == 'silent':
+            output = SilentOutputSink()
+        else:
+            output = OutputSink()
+        metrics = Metrics() if options.metrics is not None else None
+        transaction_manager = engine_from_arguments(options, output, metrics)
+        dispatch = get_dispatch_table(transaction_manager)
+        try:
+            if options.input_file == '-':
+                self.run(sys.stdin, dispatch, output, options.echo)
+            else:
+                with open(options.input_file) as lines:
+                    self.run(lines, dispatch, output, options.echo)
+        finally:
+            transaction_manager.close()
+            output.close()
+            if metrics is not None:
+                metrics.write(options.metrics, options.metrics_format)
+
+    def run(self, lines, dispatch, output, echo=True):
+        '''Runs every operation of the input against the transaction manager
 
         Parameters:
-            line(string): single line from the input file
-        Returns:
-            tuple: a tuple of the command and list of args
-            args length varies based on the Read, Write, dump commands
+            lines(iterable): lines of the input
+            dispatch(dict): dispatch table returned by get_dispatch_table
+            output(OutputSink): sink for the echoed input
+            echo(bool): True to print each input line before its output
         '''
-        command = line[:line.index('(')]
-        arg_string = line[line.index('(')+1:line.index(')')]
-        args = [arg.strip() for arg in arg_string.split(',')]
-        return (command, args)
-
+        for line, time, command, args in parse_trace(lines):
+            if echo:
+                output.emit('input', line)
+            handler = dispatch.get(command)
+            if handler is None:
+                output.emit('incorrect_input')
+                exit()
+            method, timed = handler
+            if timed:
+                method(*args, time)
+            else:
+                method(*args)
+            if echo:
+                output.emit('separator')
 
-    def main(self):
-        '''Starting point of the application'''    
-        n = len(sys.argv)
-        transaction_manager = TransactionManager()
-        time = 0
-        if n > 1:
-            file_name = sys.argv[1]
-            for line in fileinput.input(files=file_name):
-                if line.startswith('//'):
-                    continue
-                time += 1
-                line = line.strip('\n')
-                print(line)
-                command, args = self.parse_input(line)
-                if command == 'begin':
-                    t_id = args[0]
-                    transaction_manager.begin(t_id, time)
-                elif command == 'beginRO':
-                    t_id = args[0]
-                    transaction_manager.beginRO(t_id, time)
-                elif command == 'W':
-                    t_id = args[0]
-                    var = args[1]
-                    val = args[2]
-                    transaction_manager.write(t_id, var, val, time)
-                elif command == 'R':
-                    t_id = args[0]
-                    var = args[1]
-                    transaction_manager.read(t_id, var, time)
-                elif command == 'end':
-                    t_id = args[0]
-                    transaction_manager.end(t_id, time)
-                elif command == 'fail':
-                    s_id = args[0]
-                    transaction_manager.fail(s_id)
-                elif command == 'recover':
-                    s_id = args[0]
-                    transaction_manager.recover(s_id)
-                elif command == 'dump':
-                    transaction_manager.dump()
-                else:
-                    print("incorrect input")
-                    exit()
-                print('\n')
-
-Driver()
\ No newline at end of file
+if __name__ == '__main__':
+    Driver()
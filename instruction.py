@@ -1,5 +1,7 @@
 class Instruction:
     '''Data Model for the Instruction'''
+    __slots__ = ('t_id', 'type', 'var', 'val', 'time')
+
     def __init__(self, t_id, ins_type, var, val, time):
         '''creates and initialises a new Instruction
 
@@ -0,0 +1,163 @@
+from collections import defaultdict
+from lock_type import LockType
+
+
+class LockTable:
+    '''Lock table of a Site, indexed both by variable and by transaction.
+    Locks are stored as their LockType, so granting a lock allocates no object'''
+    __slots__ = ('holders', 'writer', 'held')
+
+    def __init__(self):
+        '''creates and initialises a new empty lock table
+
+        Returns:
+        LockTable: a new lock table with no locks held
+        '''
+        self.holders = {} # dict of var name and dict of t_id and lock type, in grant order
+        self.writer = {} # dict of var name and t_id holding the exclusive lock
+        self.held = defaultdict(dict) # dict of t_id and dict of var name and lock type
+
+    def can_acquire_read_lock(self, t_id, var_name):
+        '''Method to test if a read lock can be acquired by transaction t_id on variable var_name
+
+        Parameters:
+            self(LockTable): instance of the class
+            t_id(string): name of the transaction
+            var_name(string): name of the variable
+        Returns:
+            Boolean: return True if no other transaction holds a Write lock on var_name
+        '''
+        writer = self.writer.get(var_name)
+        return writer is None or writer == t_id
+
+    def can_acquire_write_lock(self, t_id, var_name):
+        '''Method to test if a write lock can be acquired by transaction t_id on variable var_name
+
+        Parameters:
+            self(LockTable): instance of the class
+            t_id(string): name of the transaction
+            var_name(string): name of the variable
+        Returns:
+            Boolean: return True if no other transaction holds any lock on var_name
+        '''
+        holders = self.holders.get(var_name)
+        if not holders:
+            return True
+        return len(holders) == 1 and t_id in holders
+
+    def acquire_read_lock(self, t_id, var_name):
+        '''Method to acquire read lock by transaction t_id on variable var_name
+
+        Parameters:
+            self(LockTable): instance of the class
+            t_id(string): name of the transaction
+            var_name(string): name of the variable
+        SideEffect:
+            Adds a Read lock unless t_id already holds a lock on var_name
+        '''
+        locks = self.held[t_id]
+        if var_name in locks:
+            return
+        self.holders.setdefault(var_name, {})[t_id] = LockType.READ
+        locks[var_name] = LockType.READ
+
+    def acquire_write_lock(self, t_id, var_name):
+        '''Method to acquire write lock by transaction t_id on variable var_name
+
+        Parameters:
+            self(LockTable): instance of the class
+            t_id(string): name of the transaction
+            var_name(string): name of the variable
+        SideEffect:
+            Adds a Write lock, or promotes the lock already held by t_id to a Write lock
+        '''
+        self.held[t_id][var_name] = LockType.WRITE # promotes a read lock to write lock
+        self.holders.setdefault(var_name, {})[t_id] = LockType.WRITE
+        self.writer[var_name] = t_id
+
+    def release(self, t_id, var_name):
+        '''Method to release the lock held by transaction t_id on variable var_name
+
+        Parameters:
+            self(LockTable): instance of the class
+            t_id(string): name of the transaction
+            var_name(string): name of the variable
+        SideEffect:
+            Removes the lock of t_id on var_name, if any
+        '''
+        locks = self.held.get(t_id)
+        if locks is None or locks.pop(var_name, None) is None:
+            return
+        if not locks:
+            del self.held[t_id]
+        self._drop_holder(t_id, var_name)
+
+    def release_all(self, t_id):
+        '''Method to release every lock held by transaction t_id
+
+        Parameters:
+            self(LockTable): instance of the class
+            t_id(string): name of the transaction
+        Returns:
+            dict: dictionary of var name and the type of lock t_id held on it
+        '''
+        locks = self.held.pop(t_id, {})
+        for var_name in locks:
+            self._drop_holder(t_id, var_name)
+        return locks
+
+    def _drop_holder(self, t_id, var_name):
+        '''Method to remove t_id from the holders of var_name, and as its writer if it is one'''
+        holders = self.holders[var_name]
+        del holders[t_id]
+        if not holders:
+            del self.holders[var_name]
+        if self.writer.get(var_name) == t_id:
+            del self.writer[var_name]
+
+    def clear(self):
+        '''Method to drop every lock in the table'''
+        self.holders.clear()
+        self.writer.clear()
+        self.held.clear()
+
+    def get_locks(self, t_id):
+        '''Method to get the locks held by transaction t_id
+
+        Parameters:
+            self(LockTable): instance of the class
+            t_id(string): name of the transaction
+        Returns:
+            dict: dictionary of var name and the type of lock t_id holds on it
+        '''
+        return self.held.get(t_id, {})
+
+    def get_locking_transaction(self, var_name):
+        '''Method to get all the transactions that hold lock on variable var_name
+
+        Parameters:
+            self(LockTable): instance of the class
+            var_name(string): name of the variable
+        Returns:
+            set: a set of transactions that has lock on the given variable
+        '''
+        return set(self.holders.get(var_name, ()))
+
+    def get_locking_transactions(self):
+        '''Method to get all the transactions that hold lock on any variable
+
+        Parameters:
+            self(LockTable): instance of the class
+        Returns:
+            set: a set of transactions that has lock on any variable
+        '''
+        return set(self.held)
+
+    def items(self):
+        '''Method to iterate over the locked variables
+
+        Returns:
+            iterator: pairs of var name and the transactions locking it in grant order
+        '''
+        for var_name, holders in self.holders.items():
+            yield var_name, list(holders)
@@ -0,0 +1,157 @@
+import bisect
+import json
+import math
+
+# upper bounds of the histogram buckets
+TICK_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SECOND_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 1e-1)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024)
+LONG_SECOND_BUCKETS = (1e-3, 1e-2, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+# help text of each metric
+HELP = {
+    'lock_wait_ticks': 'ticks a blocked read or write waited before it was granted',
+    'lock_wait_ticks_total': 'ticks blocked reads and writes of a variable waited before they were granted',
+    'lock_waits_total': 'blocked reads and writes of a variable that were granted',
+    'blocked_total': 'reads and writes that blocked',
+    'deadlock_checks_total': 'cycle searches run on the wait-for graph',
+    'deadlock_check_seconds': 'wall time of a cycle search on the wait-for graph',
+    'wait_for_graph_size': 'transactions with outgoing edges in the wait-for graph at a cycle search',
+    'aborts_total': 'aborted transactions by reason, deadlock, failed_site, wait_die, wound_wait or validation',
+    'commits_total': 'committed transactions',
+    'retry_passes_total': 'passes over the woken wait queues',
+    'retried_instructions': 'queued instructions retried in a pass',
+    'retry_passes_per_end': 'passes over the woken wait queues triggered by an end',
+    'write_fanout': 'sites written by a granted write',
+    'read_locks_total': 'reads of read-write transactions granted at each site',
+    'commit_fanout': 'sites a committed transaction accessed and commits at',
+    'version_history_size': 'versions kept for a variable after a commit',
+    'catch_up_batches_total': 'catch-up batches run for a recovered site',
+    'catch_up_variables_total': 'replicated variables of a recovered site made readable by the catch-up',
+    'rejoin_ticks': 'ticks from the recovery of a site until all its replicated variables are readable again',
+    'rejoin_seconds': 'wall time from the recovery of a site until all its replicated variables are readable again',
+}
+
+
+class Histogram:
+    '''Histogram with fixed buckets, their count, and the sum of the samples'''
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        '''creates and initialises a new empty histogram
+
+        Parameters:
+        bounds(tuple): ascending upper bounds of the buckets, the last bucket is unbounded
+
+        Returns:
+        Histogram: a new histogram with no samples
+        '''
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''Returns pairs of upper bound and number of samples at or below it, ending with +Inf'''
+        total = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    '''Counters and histograms of the engine. The engine only records them when it is given a Metrics,
+    so they cost nothing when disabled'''
+    def __init__(self):
+        '''creates and initialises a new empty set of metrics
+
+        Returns:
+        Metrics: a new set of metrics
+        '''
+        self.counters = {} # dict of (name, labels) and value, labels is a tuple of (label, value) pairs
+        self.histograms = {} # dict of (name, labels) and Histogram
+        self.now = 0 # latest time seen by the transaction manager
+
+    def tick(self, time):
+        '''Advances the current time of the engine to time, time'''
+        if time > self.now:
+            self.now = time
+
+    def inc(self, name, labels=(), value=1):
+        '''Adds value to the counter name with the given labels'''
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def value(self, name, labels=()):
+        '''Returns the value of the counter name with the given labels'''
+        return self.counters.get((name, labels), 0)
+
+    def observe(self, name, value, bounds, labels=()):
+        '''Adds the sample value to the histogram name with the given labels, with buckets bounds'''
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(bounds)
+        histogram.observe(value)
+
+    def snapshot(self):
+        '''Returns the metrics as a dictionary of plain values
+
+        Returns:
+            dict: dictionary with the list of counters and the list of histograms
+        '''
+        return {
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())],
+            'histograms': [{'name': name, 'labels': dict(labels), 'count': histogram.count,
+                'sum': histogram.sum, 'buckets': [[bound if bound != math.inf else '+Inf', count]
+                for bound, count in histogram.cumulative()]}
+                for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])],
+        }
+
+    def to_json(self):
+        '''Returns the snapshot of the metrics as a JSON document'''
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix='repcrec_'):
+        '''Returns the metrics in the Prometheus text exposition format
+
+        Parameters:
+            self(Metrics): instance of the class
+            prefix(string): prefix of the metric names
+        Returns:
+            string: one line per sample, with HELP and TYPE lines for each metric
+        '''
+        lines = []
+        described = set()
+        def describe(name, metric_type):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {prefix}{name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {prefix}{name} {metric_type}')
+        for (name, labels), value in sorted(self.counters.items()):
+            describe(name, 'counter')
+            lines.append(f'{prefix}{name}{format_labels(labels)} {value}')
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            describe(name, 'histogram')
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{prefix}{name}_bucket{format_labels(labels + (("le", le),))} {count}')
+            lines.append(f'{prefix}{name}_sum{format_labels(labels)} {histogram.sum}')
+            lines.append(f'{prefix}{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, format='json'):
+        '''Writes the metrics to the file path as json or prometheus text'''
+        with open(path, 'w') as f:
+            f.write(self.to_json() + '\n' if format == 'json' else self.to_prometheus())
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{label}="{value}"' for label, value in labels) + '}'
@@ -0,0 +1,58 @@
+import mmap
+import os
+from array import array
+
+# bytes of a slot: the committed value and the commit time, as signed 64 bit integers
+SLOT_SIZE = 16
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+
+class MmapStore:
+    '''Committed values and commit times of the variables of a Site in a fixed-width memory-mapped file.
+    Slot i holds the variable at position i of the indices of the site'''
+    def __init__(self, path, indices):
+        '''maps the store file, creating it with the initial values 10*j at time 0 if missing
+
+        Parameters:
+        path(string): path of the store file
+        indices(array): ascending j of every variable xj held by the site
+
+        Returns:
+        MmapStore: the mapped store
+        '''
+        size = len(indices) * SLOT_SIZE
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            initial = array('q', bytes(size))
+            initial[0::2] = array('q', (10*j for j in indices))
+            with open(path, 'wb') as f:
+                initial.tofile(f)
+        elif os.path.getsize(path) != size:
+            raise ValueError(f'{path} holds {os.path.getsize(path) // SLOT_SIZE} variables, expected {len(indices)}')
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), size) if size else None
+        self.slots = memoryview(self.map).cast('q') if size else memoryview(array('q')) # value at 2i, time at 2i+1
+
+    @staticmethod
+    def fits(val):
+        '''Returns True if val can be stored in a slot'''
+        return type(val) is int and INT64_MIN <= val <= INT64_MAX
+
+    def value(self, i):
+        return self.slots[2*i]
+
+    def time(self, i):
+        return self.slots[2*i+1]
+
+    def set(self, i, val, time):
+        '''Stores val committed at time, time in slot i'''
+        self.slots[2*i] = val
+        self.slots[2*i+1] = time
+
+    def close(self):
+        '''Flushes the mapped pages to the file and unmaps it'''
+        self.slots.release()
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        self.file.close()
@@ -0,0 +1,120 @@
+import os
+from collections import Counter
+
+
+def format_sites(sites):
+    return '\n'.join(f'{name}: ' + ','.join(f'{var}:{val}' for var, val in var_vals) for name, var_vals in sites)
+
+def format_lock_table(locks):
+    return '\n'.join(f'{var}: ' + ', '.join(t_ids) for var, t_ids in locks)
+
+# dict of event name and the function formatting its fields into the output text
+FORMATS = {
+    'input': '{}'.format,
+    'separator': '\n'.format,
+    'incorrect_input': 'incorrect input'.format,
+    'begin': '{} begins'.format,
+    'begin_read_only': 'Read Only {} begins'.format,
+    'not_started': '{} transaction is not yet started'.format,
+    'read': '{} accessed {} from the site: {} having value: {}'.format,
+    'write': '{} wrote {} to the sites: {} with value: {}'.format,
+    'blocked': 'Blocked transaction: {}'.format,
+    'abort_failed_site': 'Transaction:{} aborts due to previous access to failed site'.format,
+    'abort': 'Transaction:{} aborts'.format,
+    'commit': 'commited {}'.format,
+    'deadlock': 'Aborting transaction :{} because of deadlock'.format,
+    'prevention': 'Aborting transaction :{} to prevent a deadlock by {}'.format,
+    'validation': 'Transaction:{} aborts as a variable it accessed was committed since it began'.format,
+    'fail': 'site: {} failed'.format,
+    'recover': 'site: {} recovers'.format,
+    'site_status': '{}: {}'.format,
+    'dump': format_sites,
+    'lock_table': format_lock_table,
+}
+
+
+class OutputSink:
+    '''Output sink that prints each event as soon as it is emitted'''
+    def emit(self, event, *fields):
+        '''Outputs an event
+
+        Parameters:
+            self(OutputSink): instance of the class
+            event(string): name of the event, a key of FORMATS
+            fields(tuple): values formatted into the event text
+        '''
+        print(FORMATS[event](*fields))
+
+    def flush(self):
+        '''Writes out any buffered output'''
+
+    def close(self):
+        '''Flushes the sink once there is no more output'''
+        self.flush()
+
+
+class BufferedOutputSink(OutputSink):
+    '''Output sink that formats events into a buffer and writes it to a file descriptor in batches'''
+    def __init__(self, fd=1, flush_every=1024, flush_on_dump=True):
+        '''creates and initialises a new buffered sink
+
+        Parameters:
+        fd(int): file descriptor the output is written to
+        flush_every(int): number of events after which the buffer is written, 0 to flush only on dump and close
+        flush_on_dump(bool): True to write the buffer after every dump
+
+        Returns:
+        BufferedOutputSink: a new sink with an empty buffer
+        '''
+        self.fd = fd
+        self.flush_every = flush_every
+        self.flush_on_dump = flush_on_dump
+        self.buffer = []
+
+    def emit(self, event, *fields):
+        self.buffer.append(FORMATS[event](*fields))
+        if (self.flush_on_dump and event == 'dump') or len(self.buffer) == self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.buffer.append('')
+        data = memoryview('\n'.join(self.buffer).encode())
+        self.buffer = []
+        while data:
+            data = data[os.write(self.fd, data):]
+
+
+class SilentOutputSink(OutputSink):
+    '''Output sink that discards every event, for benchmarking'''
+    def emit(self, event, *fields):
+        pass
+
+
+class EventOutputSink(OutputSink):
+    '''Output sink that records each event as a tuple of its name and fields instead of formatting it'''
+    def __init__(self):
+        '''creates and initialises a new sink with no recorded events
+
+        Returns:
+        EventOutputSink: a new sink
+        '''
+        self.events = []
+
+    def emit(self, event, *fields):
+        self.events.append((event,) + fields)
+
+
+class CountingOutputSink(OutputSink):
+    '''Output sink that only counts the events of each name, for benchmarking'''
+    def __init__(self):
+        '''creates and initialises a new sink with no counted events
+
+        Returns:
+        CountingOutputSink: a new sink
+        '''
+        self.counts = Counter()
+
+    def emit(self, event, *fields):
+        self.counts[event] += 1
@@ -0,0 +1,50 @@
+import bisect
+import zlib
+
+
+def default_placement(num_site, num_var):
+    '''Places even variables on every site and each odd variable xj on site 1 + j mod num_site
+
+    Parameters:
+        num_site(int): number of sites
+        num_var(int): number of variables
+    Returns:
+        dict: dictionary of var name and the list of names of the sites holding it, in site order
+    '''
+    all_sites = [str(i) for i in range(1, num_site+1)]
+    single_sites = [[site_name] for site_name in all_sites] # shared by every variable on the same site
+    placement = {}
+    for j in range(1, num_var+1):
+        if j % 2 == 0:
+            placement['x'+str(j)] = all_sites
+        else:
+            placement['x'+str(j)] = single_sites[j % num_site]
+    return placement
+
+def consistent_hash_placement(num_site, num_var, replication_factor, virtual_nodes=128):
+    '''Places each variable on replication_factor sites using a consistent hash ring
+
+    Parameters:
+        num_site(int): number of sites
+        num_var(int): number of variables
+        replication_factor(int): number of sites holding each variable
+        virtual_nodes(int): number of points of each site on the ring
+    Returns:
+        dict: dictionary of var name and the list of names of the sites holding it, primary first
+    '''
+    replication_factor = min(replication_factor, num_site)
+    ring = sorted((zlib.crc32(f'{i}#{v}'.encode()), str(i))
+        for i in range(1, num_site+1) for v in range(virtual_nodes))
+    points = [point for point, site_name in ring]
+    placement = {}
+    for j in range(1, num_var+1):
+        var_name = 'x'+str(j)
+        idx = bisect.bisect_left(points, zlib.crc32(var_name.encode()))
+        replicas = []
+        while len(replicas) < replication_factor:
+            site_name = ring[idx % len(ring)][1]
+            if site_name not in replicas:
+                replicas.append(site_name)
+            idx += 1
+        placement[var_name] = replicas
+    return placement
@@ -0,0 +1,124 @@
+import random
+import zlib
+
+# names of the read routing policies, 'first' being the default of trying the replicas in placement order
+READ_ROUTING_POLICIES = ('first', 'round-robin', 'least-loaded', 'sticky', 'random')
+
+
+class ReadRouting:
+    '''Policy choosing the replica that serves a read. The SiteManager tries the replicas in the order
+    returned by order and reads from the first live one that grants the read. This policy keeps the
+    placement order, so every read of a replicated variable goes to its first live site'''
+    def order(self, transaction, replicas):
+        '''Returns the replicas of a variable in the order they are tried for a read of the transaction
+
+        Parameters:
+            self(ReadRouting): instance of the class
+            transaction(Transaction): the transaction reading
+            replicas(list): list of (site, site bit) holding the variable, in placement order
+        Returns:
+            list: the same replicas, in the order to try them
+        '''
+        return replicas
+
+    def acquired(self, t_id, site_name, var):
+        '''Called once transaction t_id holds a lock on var at the site site_name'''
+
+    def released(self, t_id):
+        '''Called once transaction t_id committed or aborted and released all its locks'''
+
+    def failed(self, site_name):
+        '''Called once the site site_name failed and lost its locks'''
+
+
+class RoundRobin(ReadRouting):
+    '''Starts each read at the next replica in turn'''
+    def __init__(self):
+        self.turn = 0
+
+    def order(self, transaction, replicas):
+        if len(replicas) < 2:
+            return replicas
+        self.turn += 1
+        start = self.turn % len(replicas)
+        return replicas[start:] + replicas[:start]
+
+
+class LeastLoaded(ReadRouting):
+    '''Tries first the replicas whose site holds the fewest locks of active transactions, in placement
+    order among equally loaded ones. The locks are counted from the reads and writes the SiteManager
+    granted, so that no site is asked for its lock table'''
+    def __init__(self):
+        self.load = {} # dict of site name and number of locks held there
+        self.held = {} # dict of t_id and dict of site name and set of var names it holds a lock on
+
+    def order(self, transaction, replicas):
+        if len(replicas) < 2:
+            return replicas
+        load = self.load
+        return sorted(replicas, key=lambda replica: load.get(replica[0].name, 0))
+
+    def acquired(self, t_id, site_name, var):
+        locks = self.held.setdefault(t_id, {}).setdefault(site_name, set())
+        if var not in locks:
+            locks.add(var)
+            self.load[site_name] = self.load.get(site_name, 0) + 1
+
+    def released(self, t_id):
+        for site_name, locks in self.held.pop(t_id, {}).items():
+            self.load[site_name] -= len(locks)
+
+    def failed(self, site_name):
+        self.load[site_name] = 0
+        for sites in self.held.values():
+            sites.pop(site_name, None)
+
+
+class Sticky(ReadRouting):
+    '''Tries first the replicas on sites the transaction already accessed, so that it commits at and
+    depends on as few sites as possible. A transaction reading from a new site starts at a replica
+    chosen by a hash of its id, which spreads the transactions over the sites'''
+    def order(self, transaction, replicas):
+        if len(replicas) < 2:
+            return replicas
+        accessed = transaction.sites_accessed
+        if accessed:
+            preferred = [replica for replica in replicas if replica[0].name in accessed]
+            if preferred:
+                return preferred + [replica for replica in replicas if replica[0].name not in accessed]
+        start = zlib.crc32(transaction.id.encode()) % len(replicas)
+        return replicas[start:] + replicas[:start]
+
+
+class RandomReplica(ReadRouting):
+    '''Starts each read at a replica chosen at random'''
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def order(self, transaction, replicas):
+        if len(replicas) < 2:
+            return replicas
+        start = self.rng.randrange(len(replicas))
+        return replicas[start:] + replicas[:start]
+
+
+def create_read_routing(name, seed=0):
+    '''Returns the read routing policy called name
+
+    Parameters:
+        name(string): one of READ_ROUTING_POLICIES
+        seed(int): seed of the random policy
+    Returns:
+        ReadRouting: the policy, None for 'first' which the SiteManager runs without a policy
+    '''
+    if name == 'first':
+        return None
+    if name == 'round-robin':
+        return RoundRobin()
+    if name == 'least-loaded':
+        return LeastLoaded()
+    if name == 'sticky':
+        return Sticky()
+    if name == 'random':
+        return RandomReplica(seed)
+    raise ValueError(f'unknown read routing policy {name}')
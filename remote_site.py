@@ -0,0 +1,171 @@
+import multiprocessing
+import signal
+from status import Status
+from output_sink import OutputSink
+
+# workers are forked so that they share the placement and the string hashing of the parent
+context = multiprocessing.get_context('fork')
+
+
+class RemoteSite:
+    '''Proxy of a Site running in its own worker process. Every call is a message over a pipe, and
+    send and receive are split so that the SiteManager can run a call on several sites in parallel'''
+    def __init__(self, name, factory, output=None):
+        '''starts the worker process of the site
+
+        Parameters:
+            self(RemoteSite): instance of the class
+            name(string): name of the site
+            factory(callable): creates the Site in the worker, with its variables, log and store
+            output(OutputSink): sink for the output messages, prints them if None
+        Returns:
+            RemoteSite: the proxy of the site, available
+        '''
+        self.output = output if output is not None else OutputSink()
+        self.name = name
+        self.status = Status.AVAILABLE # mirrors the status of the site in the worker
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=serve_site, args=(child, factory), daemon=True)
+        self.process.start()
+        child.close() # the worker replies once the site is created, read by receive
+
+    def send(self, method, *args):
+        '''Sends the call of method with args, whose result is read by receive'''
+        self.conn.send((method, args, True))
+
+    def post(self, method, *args):
+        '''Sends the call of method with args without waiting for it'''
+        self.conn.send((method, args, False))
+
+    def receive(self):
+        '''Returns the result of the oldest call sent, raising the exception it raised in the worker'''
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def call(self, method, *args):
+        '''Sends the call of method with args and returns its result'''
+        self.send(method, *args)
+        return self.receive()
+
+    def read(self, t_id, var_name, read_only=False, start_time=0):
+        '''Calls Site.read in the worker'''
+        return self.call('read', t_id, var_name, read_only, start_time)
+
+    def read_many(self, start_time, var_names):
+        '''Calls Site.read_many in the worker'''
+        return self.call('read_many', start_time, var_names)
+
+    def unreadable_replicated(self, position, limit):
+        '''Calls Site.unreadable_replicated in the worker'''
+        return self.call('unreadable_replicated', position, limit)
+
+    def export_versions(self, var_names):
+        '''Calls Site.export_versions in the worker'''
+        return self.call('export_versions', var_names)
+
+    def import_versions(self, versions, low_watermark=None):
+        '''Calls Site.import_versions in the worker'''
+        return self.call('import_versions', versions, low_watermark)
+
+    def can_acquire_write_lock(self, t_id, var_name):
+        '''Calls Site.can_acquire_write_lock in the worker'''
+        return self.call('can_acquire_write_lock', t_id, var_name)
+
+    def write(self, t_id, var_name, val):
+        '''Calls Site.write in the worker'''
+        return self.call('write', t_id, var_name, val)
+
+    def write_locked(self, t_id, var_name, val):
+        '''Calls Site.write_locked in the worker'''
+        return self.call('write_locked', t_id, var_name, val)
+
+    def commit(self, t_id, writes, time, low_watermark=None, defer_sync=False, locked=True):
+        '''Calls Site.commit in the worker'''
+        return self.call('commit', t_id, writes, time, low_watermark, defer_sync, locked)
+
+    def abort(self, t_id, written):
+        '''Calls Site.abort in the worker'''
+        return self.call('abort', t_id, written)
+
+    def sync_log(self):
+        '''Calls Site.sync_log in the worker'''
+        return self.call('sync_log')
+
+    def collect(self, low_watermark):
+        '''Posts Site.collect to the worker without waiting for it'''
+        self.post('collect', low_watermark)
+
+    def committed_items(self):
+        '''Calls Site.committed_items in the worker'''
+        return self.call('committed_items')
+
+    def lock_items(self):
+        '''Calls Site.lock_items in the worker'''
+        return self.call('lock_items')
+
+    def get_locking_transaction(self, var):
+        '''Returns the transactions holding a lock on var at the site'''
+        # the holders are sent in lock order so the set is built as the one of an in-process site
+        return set(self.call('holders', var))
+
+    def get_locking_transaction_on_site(self):
+        '''Calls Site.get_locking_transaction_on_site in the worker'''
+        return set(self.call('get_locking_transaction_on_site'))
+
+    def get_locked_variables(self, t_id=None):
+        '''Calls Site.get_locked_variables in the worker'''
+        return self.call('get_locked_variables', t_id)
+
+    def fail(self):
+        '''Fails the site in the worker and marks the proxy failed'''
+        self.status = Status.FAILED
+        self.call('fail')
+
+    def recover(self, low_watermark=None):
+        '''Recovers the site in the worker and marks the proxy available'''
+        self.call('recover', low_watermark)
+        self.status = Status.AVAILABLE
+
+    def print_site_status(self):
+        '''Prints the status of the site as Site.print_site_status does'''
+        self.output.emit('site_status', self.name, self.status)
+
+    def close(self):
+        '''Closes the log and store of the site and stops its worker'''
+        self.call('close')
+        self.conn.send(None)
+        self.process.join()
+        self.conn.close()
+
+
+def serve_site(conn, factory):
+    '''Runs the calls received on conn against the Site created by factory, until it receives None
+
+    Parameters:
+        conn(Connection): end of the pipe of the worker
+        factory(callable): creates the Site
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the parent closes the workers on interrupt
+    try:
+        site = factory()
+    except Exception as error:
+        conn.send((False, error))
+        conn.close()
+        return
+    conn.send((True, None)) # ready, once the site is restored
+    handlers = {'holders': lambda var: list(site.lock_table.holders.get(var, ()))}
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        method, args, reply = message
+        try:
+            handler = handlers.get(method) or getattr(site, method)
+            result = (True, handler(*args))
+        except Exception as error:
+            result = (False, error)
+        if reply:
+            conn.send(result)
+    conn.close()
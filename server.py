@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import signal
+from driver import COMMANDS, parse_line, get_dispatch_table, add_engine_arguments, engine_from_arguments
+from output_sink import OutputSink, FORMATS
+from metrics import Metrics
+
+DEFAULT_PORT = 7474
+
+# events whose first field is the id of the transaction they belong to
+TRANSACTION_EVENTS = {'begin', 'begin_read_only', 'not_started', 'read', 'write', 'blocked',
+    'abort_failed_site', 'abort', 'commit', 'deadlock', 'prevention', 'validation'}
+
+
+class ReplyOutputSink(OutputSink):
+    '''Output sink that collects the events of each request into its reply instead of printing them.
+    Events of a transaction whose request is waiting for a lock go to that request'''
+    def __init__(self):
+        '''creates and initialises a new sink with no request running
+
+        Returns:
+        ReplyOutputSink: a new sink
+        '''
+        self.current = [] # (event, text) of the request being run
+        self.waiting = {} # dict of t_id and (event, text) of its request waiting for a lock
+
+    def emit(self, event, *fields):
+        events = self.current
+        if event in TRANSACTION_EVENTS:
+            events = self.waiting.get(fields[0], events)
+        events.append((event, FORMATS[event](*fields)))
+
+
+class Server:
+    '''Runs the requests of many client sessions against a single TransactionManager in the event loop.
+    Each request is given the next logical time when it arrives, and its reply is sent once it is
+    granted, which for a blocked read or write is when a later request unblocks it'''
+    def __init__(self, transaction_manager, output):
+        '''creates and initialises a new server
+
+        Parameters:
+            self(Server): instance of the class
+            transaction_manager(TransactionManager): the transaction manager, writing to output
+            output(ReplyOutputSink): the output sink of the transaction manager
+        Returns:
+            Server: a new server, at time 0
+        '''
+        self.transaction_manager = transaction_manager
+        self.output = output
+        self.dispatch = get_dispatch_table(transaction_manager)
+        self.time = 0
+        self.futures = {} # dict of t_id and (future, time) of its request waiting for a lock
+
+    def submit(self, line):
+        '''Runs the request line at the next logical time
+
+        Parameters:
+            self(Server): instance of the class
+            line(string): a command of the input grammar
+        Returns:
+            Future: completed with the reply, a dictionary of the time of the request, the status of its
+            transaction and the names and text of the events it caused. A malformed line, one naming an
+            unknown site and one the engine fails to run are answered with incorrect input
+        '''
+        future = asyncio.get_running_loop().create_future()
+        self.time += 1
+        time = self.time
+        events = self.output.current = []
+        try:
+            command, args = parse_line(line)
+        except ValueError:
+            command, args = None, ()
+        handler = self.dispatch.get(command)
+        if (handler is None or len(args) != COMMANDS[command]
+                or command in ('fail', 'recover') and args[0] not in self.transaction_manager.site_manager.sites):
+            self.output.emit('incorrect_input')
+            command = None
+        else:
+            method, timed = handler
+            try:
+                if timed:
+                    method(*args, time)
+                else:
+                    method(*args)
+            except Exception:
+                # a request the engine cannot run is answered like a malformed one, keeping the session open
+                self.output.emit('incorrect_input')
+                command = None
+            self.transaction_manager.settle()
+        self.output.current = []
+        t_id = args[0] if command in ('begin', 'beginRO', 'R', 'W', 'end') else None
+        for waiting_t_id in list(self.futures):
+            if not self.transaction_manager.is_waiting(waiting_t_id):
+                waiting_future, waiting_time = self.futures.pop(waiting_t_id)
+                waiting_future.set_result(self.reply(waiting_time, waiting_t_id,
+                    self.output.waiting.pop(waiting_t_id)))
+        if command in ('R', 'W') and self.transaction_manager.is_waiting(t_id):
+            self.futures[t_id] = (future, time)
+            self.output.waiting[t_id] = events
+        else:
+            future.set_result(self.reply(time, t_id, events))
+        return future
+
+    def reply(self, time, t_id, events):
+        '''Returns the reply of the request run at time, time for transaction t_id'''
+        status = None
+        if t_id is not None:
+            transaction = self.transaction_manager.transaction_map.get(t_id)
+            status = transaction.status.name if transaction is not None else 'ENDED'
+        return {'time': time, 'status': status, 'events': [event for event, text in events],
+            'output': [text for event, text in events]}
+
+    async def handle(self, reader, writer):
+        '''Serves a client session, one request per line and one JSON reply per line, in order'''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if not line or line.startswith('//'):
+                    continue
+                reply = await self.submit(line)
+                writer.write((json.dumps(reply) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(server, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT):
+    '''Accepts client sessions on the Unix socket socket_path, or on host and port, until interrupted'''
+    if socket_path is not None:
+        listener = await asyncio.start_unix_server(server.handle, socket_path)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    async with listener:
+        await stop.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves concurrent client sessions on a local socket')
+    parser.add_argument('--socket', default=None, help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port to listen on')
+    add_engine_arguments(parser)
+    options = parser.parse_args()
+    output = ReplyOutputSink()
+    metrics = Metrics() if options.metrics is not None else None
+    transaction_manager = engine_from_arguments(options, output, metrics)
+    try:
+        asyncio.run(serve(Server(transaction_manager, output), options.socket, options.host, options.port))
+    finally:
+        transaction_manager.close()
+        if metrics is not None:
+            metrics.write(options.metrics, options.metrics_format)
+
+if __name__ == '__main__':
+    main()
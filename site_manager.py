@@ -1,12 +1,20 @@
+import os
+import time as clock
 from status import Status
 from lock_type import LockType
 from collections import defaultdict
-from variable import Variable
-from lock import Lock
-import bisect
+from variable_table import VariableTable, variable_index
+from array import array
+from lock_table import LockTable
+from output_sink import OutputSink
+from placement import default_placement
+from metrics import SIZE_BUCKETS, TICK_BUCKETS, LONG_SECOND_BUCKETS
+from mmap_store import MmapStore
+from remote_site import RemoteSite
+from functools import partial
 class Site:
     '''class that describes a Site'''
-    def __init__(self,name, status, vars):
+    def __init__(self,name, status, vars, output=None):
         '''creates and initialises a new Site
 
         Parameters:
@@ -14,13 +22,20 @@ class Site:
             name(string): name of the site
             status(Status): status of the Site i.e AVAILABLE, FAILED
             vars(dict): dictionary of variable name and object
+            output(OutputSink): sink for the output messages, prints them if None
         Returns:
             Site: a new Site object initialized with the given values
         '''  
+        self.output = output if output is not None else OutputSink()
         self.name = name
         self.status = status
-        self.variables = vars #dict of var name and var obj
-        self.lock_table = defaultdict(list) # dict of var name and list of locks
+        self.variables = vars #VariableTable of var name and var obj
+        self.lock_table = LockTable() # locks indexed by var name and by transaction
+        self.log = None # SiteLog of the committed writes, None if they are only kept in memory
+        self.versioned_variables = set() # variables holding more than one committed version
+        # dict of var name and Variable whose commit is in the log but not yet known to be on disk, and so is
+        # not yet written to the store, which must never hold a commit the log could lose
+        self.unpersisted = {}
 
     def can_acquire_read_lock(self, t_id, var_name):
         '''Method to test if a read lock can be acquired by transaction t_id on variable var_name
@@ -32,10 +47,7 @@ class Site:
         Returns:
             Boolean: return True if t_id can acquire Read lock otherwise False
         '''          
-        for lock in self.lock_table[var_name]:
-            if lock.t_id != t_id and lock.lock_type == LockType.WRITE: 
-                return False
-        return True
+        return self.lock_table.can_acquire_read_lock(t_id, var_name)
 
     def acquire_read_lock(self, t_id, var_name):
         '''Method to acquire read lock by transaction t_id on variable var_name
@@ -47,10 +59,7 @@ class Site:
         SideEffect:
             Add the lock to the locktable of the current site.
         '''          
-        for lock in self.lock_table[var_name]:
-            if lock.t_id == t_id:
-                return
-        self.lock_table[var_name].append(Lock(LockType.READ, var_name, t_id))
+        self.lock_table.acquire_read_lock(t_id, var_name)
 
     def can_acquire_write_lock(self, t_id, var_name):
         '''Method to test if a write lock can be acquired by transaction t_id on variable var_name
@@ -62,10 +71,7 @@ class Site:
         Returns:
             Boolean: return True if t_id can acquire Write lock otherwise False
         '''          
-        for lock in self.lock_table[var_name]:
-            if lock.lock_type != LockType.NO_LOCK and lock.t_id != t_id:
-                return False
-        return True
+        return self.lock_table.can_acquire_write_lock(t_id, var_name)
 
     def acquire_write_lock(self, t_id, var_name):
         '''Method to acquire write lock by transaction t_id on variable var_name
@@ -78,17 +84,7 @@ class Site:
             if lock doesn't exist then add the lock to the locktable of the current site otherwise
             promotes the lock to a Write lock.
         '''          
-        found = False
-        curr_lock = None
-        for lock in self.lock_table[var_name]:
-            if lock.t_id == t_id:
-                curr_lock = lock
-                found = True
-                break
-        if not found:
-            self.lock_table[var_name].append(Lock(LockType.WRITE, var_name, t_id))
-        else:
-            curr_lock.lock_type = LockType.WRITE # promote lock to write lock
+        self.lock_table.acquire_write_lock(t_id, var_name)
 
 
     def release_locks(self,t_id, var_name):
@@ -101,11 +97,18 @@ class Site:
         SideEffect:
             update the lock table of the current site by removing all the locks held by t_id on var_name
         '''          
-        cpy_list = []
-        for lock in self.lock_table[var_name]:
-            if lock.t_id != t_id:
-                cpy_list.append(lock)
-        self.lock_table[var_name] = cpy_list
+        self.lock_table.release(t_id, var_name)
+
+    def release_all_locks(self, t_id):
+        '''Method to release every lock held by transaction t_id at this Site
+
+        Parameters:
+            self(Site): instance of the class
+            t_id(string): name of the transaction
+        Returns:
+            dict: dictionary of var name and the type of lock t_id held on it
+        '''
+        return self.lock_table.release_all(t_id)
 
     def fail(self):
         '''Method to fail a Site
@@ -113,24 +116,29 @@ class Site:
         Parameters:
             self(Site): Object of Site class
         SideEffect:
-            update the status of the Site to Failed and clear all the locks held at the Site
+            update the status of the Site to Failed and clear all the locks held at the Site.
+            Values written by uncommitted transactions are lost
         '''          
         self.status = Status.FAILED
-        for key, locks in self.lock_table.items():
-            locks.clear()
+        for var_name in self.lock_table.writer:
+            variable = self.variables.get(var_name)
+            if variable is not None:
+                variable.val = variable.commited_value
+        self.lock_table.clear()
         #make all replicated var as non-readable:
-        for var in self.variables.values():
-            if var.replicated:
-                var.readable = False
+        self.variables.mark_replicated_unreadable()
     
-    def recover(self):
+    def recover(self, low_watermark=None):
         '''Method to recover a failed Site
 
         Parameters:
             self(Site): Object of Site class
+            low_watermark(int): start time of the oldest active read-only transaction
         SideEffect:
-            update the status of a failed Site to Available
+            update the status of a failed Site to Available, restoring its variables from its log if it has one
         '''          
+        if self.log is not None:
+            self.restore(low_watermark)
         self.status = Status.AVAILABLE
     
     def can_read(self, t_id, var_name):
@@ -147,7 +155,7 @@ class Site:
             return False
         if var_name not in self.variables:
             return False
-        if self.variables[var_name].readable == False:
+        if not self.variables.is_readable(var_name):
             return False
         return self.can_acquire_read_lock(t_id, var_name)
 
@@ -164,7 +172,7 @@ class Site:
             return False
         if var_name not in self.variables:
             return False
-        if self.variables[var_name].readable == False:
+        if not self.variables.is_readable(var_name):
             return False 
         return True          
 
@@ -193,10 +201,7 @@ class Site:
         Returns:
             set: a set of transactions that has lock on the given variable
         '''            
-        t_ids = set()
-        for lock in self.lock_table[var]:
-            t_ids.add(lock.t_id)
-        return t_ids
+        return self.lock_table.get_locking_transaction(var)
     
     def print_site_status(self):
         '''Method to print the status of this Site.
@@ -206,7 +211,7 @@ class Site:
         SideEffect:
             prints the name and status of the Site
         '''           
-        print(f'{self.name}: {self.status}')
+        self.output.emit('site_status', self.name, self.status)
 
     def get_locking_transaction_on_site(self):
         '''Method to get all the transactions that hold lock on any variable at this Site.
@@ -216,38 +221,412 @@ class Site:
         Returns:
             set: a set of transactions that has lock on any variable at this Site.
         '''           
-        t_ids = set()
-        for locks in self.lock_table.values():
-            for lock in locks:
-                t_ids.update(lock.t_id)
-        return t_ids
+        return self.lock_table.get_locking_transactions()
+
+    def get_locked_variables(self, t_id=None):
+        '''Method to get the variables locked at this Site, by t_id if given otherwise by any transaction.
+
+        Parameters:
+            self(Site): instance of the class.
+            t_id(string): name of the transaction
+        Returns:
+            list: a list of locked variable names
+        '''
+        if t_id is None:
+            return list(self.lock_table.holders)
+        return list(self.lock_table.get_locks(t_id))
+
+    def read(self, t_id, var_name, read_only=False, start_time=0):
+        '''Method to read var_name at this Site for transaction t_id, taking a read lock unless read_only
+
+        Parameters:
+            self(Site): instance of the class.
+            t_id(string): name of the transaction
+            var_name(string): name of the var_name
+            read_only(bool): True to read the version committed before start_time without a lock
+            start_time(int): start time of the read-only transaction
+        Returns:
+            the value read, None if var_name is not readable here or the read lock is held by another transaction
+        '''
+        variables = self.variables
+        if not variables.is_readable(var_name):
+            return None
+        if read_only:
+            return variables.read_at(var_name, start_time)
+        if not self.lock_table.can_acquire_read_lock(t_id, var_name):
+            return None
+        self.lock_table.acquire_read_lock(t_id, var_name)
+        return variables[var_name].val
+
+    def read_many(self, start_time, var_names):
+        '''Method to read var_names at this Site at the snapshot of a read-only transaction
+
+        Parameters:
+            self(Site): instance of the class.
+            start_time(int): start time of the read-only transaction
+            var_names(list): names of the variables, in variable order to read them in a single pass
+        Returns:
+            list: the value of each variable, None for the ones not readable here
+        '''
+        return self.variables.read_many_at(var_names, start_time)
+
+    def unreadable_replicated(self, position, limit):
+        '''Method to find the replicated variables of this Site that are not readable, as after a recovery
+
+        Parameters:
+            self(Site): instance of the class.
+            position(int): position in the variables of the site to start from
+            limit(int): number of variables to check
+        Returns:
+            tuple: the list of names found and the position to continue from
+        '''
+        return self.variables.unreadable_replicated(position, limit)
+
+    def export_versions(self, var_names):
+        '''Method to copy the committed versions of var_names for a recovering replica
+
+        Parameters:
+            self(Site): instance of the class.
+            var_names(list): names of the variables
+        Returns:
+            tuple: dictionary of var name and list of (commit time, value) of the readable variables that
+            no active transaction holds a write lock on, and the list of the names that one does
+        '''
+        versions = {}
+        locked = []
+        writer = self.lock_table.writer
+        variables = self.variables
+        for var_name in var_names:
+            if var_name in writer:
+                locked.append(var_name)
+            elif variables.is_readable(var_name):
+                versions[var_name] = variables.versions_of(var_name)
+        return (versions, locked)
+
+    def import_versions(self, versions, low_watermark=None):
+        '''Method to install the committed versions copied from a live replica, making the variables readable
+
+        Parameters:
+            self(Site): instance of the class.
+            versions(dict): dictionary of var name and list of (commit time, value) in commit time order
+            low_watermark(int): start time of the oldest active read-only transaction
+        Returns:
+            tuple: the names of the variables installed, and the names of the ones skipped as an active
+            transaction holds a write lock on them here. Variables already readable again are skipped too
+        '''
+        installed = []
+        locked = []
+        writer = self.lock_table.writer
+        variables = self.variables
+        for var_name, items in versions.items():
+            if var_name in writer:
+                locked.append(var_name)
+                continue
+            if variables.is_readable(var_name):
+                continue
+            variable = variables[var_name]
+            history = variable.version_history
+            for time, val in items:
+                history.append(time, val)
+            history.collect(low_watermark)
+            time, val = items[-1]
+            if time >= variable.commited_time:
+                variable.val = variable.commited_value = val
+                variable.commited_time = time
+            variables.mark_readable(variable)
+            if len(history) > 1:
+                self.versioned_variables.add(variable)
+            if variables.store is not None:
+                variables.persist(variable)
+            installed.append(var_name)
+        return (installed, locked)
+
+    def write(self, t_id, var_name, val):
+        '''Method to write val to var_name at this Site for transaction t_id, once can_acquire_write_lock holds
+
+        Parameters:
+            self(Site): instance of the class.
+            t_id(string): name of the transaction
+            var_name(string): name of the var_name
+            val(int): value written
+        '''
+        self.lock_table.acquire_write_lock(t_id, var_name)
+        self.variables[var_name].val = val
+
+    def write_locked(self, t_id, var_name, val):
+        '''Method to write val to var_name at this Site for transaction t_id, if it still holds its write lock
+
+        Parameters:
+            self(Site): instance of the class.
+            t_id(string): name of the transaction
+            var_name(string): name of the var_name
+            val(int): value written
+        Returns:
+            Boolean: True if the value was written, False if the site lost the lock in a failure
+        '''
+        if self.lock_table.writer.get(var_name) != t_id:
+            return False
+        self.variables[var_name].val = val
+        return True
+
+    def commit(self, t_id, writes, time, low_watermark=None, defer_sync=False, locked=True):
+        '''Method to commit transaction t_id at this Site
+
+        Parameters:
+            self(Site): instance of the class.
+            t_id(string): name of the transaction
+            writes(list): list of var name and value written by t_id at this Site
+            time(int): commit time
+            low_watermark(int): start time of the oldest active read-only transaction
+            defer_sync(bool): True to leave the sync of the log to sync_log
+            locked(bool): False to commit every write, for an optimistic transaction that holds no locks
+        Returns:
+            tuple: True if the commit was logged, and the number of versions kept for each variable committed.
+            Only the writes whose write lock t_id still held are committed, unless locked is False
+        '''
+        released = self.lock_table.release_all(t_id)
+        variables = self.variables
+        log = self.log
+        sizes = []
+        for var_name, val in writes:
+            if locked and released.get(var_name) != LockType.WRITE:
+                continue
+            #commit the values
+            variable = variables[var_name]
+            if log is not None:
+                log.append(var_name, val)
+            variable.val = variable.commited_value = val
+            variable.commited_time = time
+            variables.mark_readable(variable)
+            history = variable.version_history
+            history.append(time, val)
+            history.collect(low_watermark)
+            if len(history) > 1:
+                self.versioned_variables.add(variable)
+            sizes.append(len(history))
+            if variables.store is not None:
+                if log is None:
+                    variables.persist(variable)
+                else:
+                    self.unpersisted[var_name] = variable
+        if log is None or not sizes:
+            return (False, sizes)
+        log.commit(time, defer_sync)
+        if log.should_checkpoint():
+            log.checkpoint(variables.version_items())
+        self.persist_synced()
+        return (True, sizes)
+
+    def abort(self, t_id, written):
+        '''Method to abort transaction t_id at this Site
+
+        Parameters:
+            self(Site): instance of the class.
+            t_id(string): name of the transaction
+            written(list): names of the variables written by t_id at this Site
+        SideEffect:
+            Removes all the locks held by t_id, and restores the committed value of the variables
+            it wrote whose locks it still held
+        '''
+        released = self.lock_table.release_all(t_id)
+        for var_name in written:
+            if var_name in released:
+                var = self.variables[var_name]
+                var.val = var.commited_value
+
+    def sync_log(self):
+        '''Method to sync the log of this Site once a group of commits is written to it'''
+        self.log.sync_if_due()
+        self.persist_synced()
+
+    def persist_synced(self):
+        '''Method to write the commits to the store once the log holding them is synced
+
+        Parameters:
+            self(Site): instance of the class.
+        SideEffect:
+            With group commit, the commits of a group reach the store together, after the log is fsynced,
+            so that after a crash the store holds no commit, or part of one, that the log lost
+        '''
+        if not self.unpersisted or self.log.unsynced:
+            return
+        variables = self.variables
+        for var_name, variable in self.unpersisted.items():
+            if variables.records.get(var_name) is variable:
+                variables.persist(variable)
+        self.unpersisted.clear()
+
+    def collect(self, low_watermark):
+        '''Method to drop the versions no read-only transaction started after low_watermark needs
+
+        Parameters:
+            self(Site): instance of the class.
+            low_watermark(int): start time of the oldest active read-only transaction, None if there is none
+        '''
+        for variable in list(self.versioned_variables):
+            variable.version_history.collect(low_watermark)
+            if len(variable.version_history) == 1:
+                self.versioned_variables.discard(variable)
+
+    def restore(self, low_watermark=None):
+        '''Method to rebuild the variables of this Site from its last checkpoint and log
+
+        Parameters:
+            self(Site): instance of the class.
+            low_watermark(int): start time of the oldest active read-only transaction
+        SideEffect:
+            Uncommitted values at the Site are lost, as after a crash
+        '''
+        self.versioned_variables.difference_update(self.variables.records.values())
+        self.unpersisted.clear() # replayed from the log, which load syncs
+        self.variables.restore(self.log.load(), low_watermark)
+        for variable in self.variables.records.values():
+            if len(variable.version_history) > 1:
+                self.versioned_variables.add(variable)
+
+    def committed_items(self):
+        '''Method to get the pairs of var name and committed value of this Site, in variable order'''
+        return list(self.variables.committed_items())
+
+    def lock_items(self):
+        '''Method to get the pairs of var name and lock held on it at this Site'''
+        return list(self.lock_table.items())
+
+    def close(self):
+        '''Method to sync and close the log and store of this Site'''
+        if self.log is not None:
+            self.log.sync()
+            self.persist_synced()
+            self.log.close()
+        if self.variables.store is not None:
+            self.variables.store.close()
+
+
+def create_site(site_name, indices, placement, output=None, wal=None, store_dir=None, low_watermark=None):
+    '''creates the Site site_name holding the variables at indices, with its log and store
+
+    Parameters:
+        site_name(string): name of the site
+        indices(array): ascending j of every variable xj held by the site
+        placement(dict): dictionary of var name and the list of names of the sites holding it
+        output(OutputSink): sink for the output messages, prints them if None
+        wal(WriteAheadLog): settings of the write-ahead logs, None to keep the data only in memory
+        store_dir(string): directory of the memory-mapped stores, None to keep the values in memory
+        low_watermark(int): start time of the oldest active read-only transaction
+    Returns:
+        Site: the site, restored from its log if it has one
+    '''
+    store = None
+    if store_dir is not None:
+        store = MmapStore(os.path.join(store_dir, 'site' + site_name + '.dat'), indices)
+    site = Site(site_name, Status.AVAILABLE, VariableTable(indices, placement, store), output)
+    if wal is not None:
+        site.log = wal.open(site_name)
+        site.restore(low_watermark)
+    return site
 
 
 class SiteManager:
     '''class that manages all the sites and abstracts the underlying distribution of the Site'''
-    def __init__(self, num_site, num_var):
+    def __init__(self, num_site, num_var, output=None, placement=None, metrics=None, wal=None, store_dir=None,
+            site_processes=False, catch_up_batch=None, read_routing=None):
         '''creates and initialises a new Site Manager
 
         Parameters:
             self(SiteManager): instance of the class.
+            num_site(int): number of sites
+            num_var(int): number of variables
+            output(OutputSink): sink for the output messages, prints them if None
+            placement(dict): dictionary of var name and the list of names of the sites holding it,
+                default_placement if None
+            metrics(Metrics): metrics to record, or None to record nothing
+            wal(WriteAheadLog): settings of the write-ahead logs of the sites, None to keep the data only in memory.
+                Sites with an existing log start from its committed state
+            store_dir(string): directory of the memory-mapped stores of the committed values of the sites,
+                None to keep them in memory. Sites with an existing store start from the values it holds
+            site_processes(bool): True to run each site in its own worker process, called over a pipe
+            catch_up_batch(int): number of variables of each recovered site checked per catch_up step, None to
+                leave replicated variables unreadable there until their next commit
+            read_routing(ReadRouting): policy choosing the replica of each read, None to read from the first
+                live replica in placement order
         Returns:
         Instruction: a new SiteManager object initialized with give number of Sites and Variables.
         '''           
+        self.output = output if output is not None else OutputSink()
+        self.metrics = metrics
         self.num_site = num_site
         self.num_var = num_var
+        self.site_processes = site_processes
+        if placement is None:
+            placement = default_placement(num_site, num_var)
+        self.placement = placement
+        site_indices = {str(i): array('q') for i in range(1, num_site+1)}
+        for var_name, replicas in placement.items():
+            j = variable_index(var_name)
+            for site_name in replicas:
+                site_indices[site_name].append(j)
+        self.site_sizes = {site_name: len(indices) for site_name, indices in site_indices.items()}
         sites = defaultdict(Site)
-        for i in range(1, num_site+1):
-            variables = defaultdict(Variable)
-            for j in range(1, num_var+1):
-                if j % 2 == 0:
-                    var = Variable('x'+str(j), 10*j, Lock(LockType.NO_LOCK, 'x'+str(j)), True)
-                    variables['x'+str(j)] = var   
-                elif j % 2 != 0 and (1+ j%10) == i:
-                    var = Variable('x'+str(j), 10*j, Lock(LockType.NO_LOCK, 'x'+str(j)))
-                    variables['x'+str(j)] = var                         
-            s = Site(str(i),Status.AVAILABLE, variables)
-            sites[str(i)] = s        
+        if store_dir is not None:
+            os.makedirs(store_dir, exist_ok=True)
+        for site_name, indices in site_indices.items():
+            indices = array('q', sorted(indices))
+            if site_processes:
+                factory = partial(create_site, site_name, indices, placement, None, wal, store_dir)
+                sites[site_name] = RemoteSite(site_name, factory, self.output)
+            else:
+                sites[site_name] = create_site(site_name, indices, placement, self.output, wal, store_dir)
+        if site_processes:
+            for site in sites.values():
+                site.receive() # the sites are created and restored in parallel
         self.sites = sites
+        self.site_bits = {site_name: 1 << i for i, site_name in enumerate(sites)}
+        self.live_sites = (1 << len(sites)) - 1 # bitmap of available sites, bit i for the i-th site
+        # dict of var name and list of (site, site bit) holding it, in placement order.
+        # Variables placed on the same sites share one list
+        shared_replicas = {}
+        self.replicas = {}
+        for var_name, replica_names in placement.items():
+            key = tuple(replica_names)
+            replicas = shared_replicas.get(key)
+            if replicas is None:
+                replicas = shared_replicas[key] = [(sites[site_name], self.site_bits[site_name]) for site_name in replica_names]
+            self.replicas[var_name] = replicas
+        self.low_watermark = None # start time of the oldest active read-only transaction
+        # bumped whenever the replica a read-only read picks may change, which empties the snapshot views.
+        # That is on every failure and recovery, and on every commit once a site failed, as a commit
+        # makes a replicated variable readable again at a recovered site
+        self.generation = 0
+        self.failed_once = False
+        # number of failures and recoveries, which change the live replicas of the variables and the locks
+        # held on them. A write lock held on every live replica stays so while this count is unchanged
+        self.availability_changes = 0
+        self.catch_up_batch = catch_up_batch
+        # dict of name of a recovered site and list of the position of the next variable to check,
+        # the names to copy again, and the tick and perf_counter time of the recovery
+        self.catching_up = {}
+        # dict of var name and number of active optimistic transactions that buffered a write of it. Their
+        # commits skip replicas that recovered after the write, so catch_up leaves these variables unreadable
+        # there, as if write-locked, until no such transaction is left
+        self.buffered_writes = {}
+        self.read_routing = read_routing
+
+    def fan_out(self, method, calls):
+        '''Calls method on several sites and returns their results
+
+        Parameters:
+            self(SiteManager): instance of the class.
+            method(string): name of the Site method
+            calls(list): list of site and tuple of the arguments of its call
+        Returns:
+            list: the result of each call, in order. Sites in worker processes are sent every call
+            before any result is awaited, so they run them in parallel
+        '''
+        if not self.site_processes:
+            return [getattr(site, method)(*args) for site, args in calls]
+        for site, args in calls:
+            site.send(method, *args)
+        return [site.receive() for site, args in calls]
 
     def read(self, transaction, var):
         '''Reads the variable var for the given transaction
@@ -260,19 +639,104 @@ class SiteManager:
         tuple: a tuple of variable values and site from which it is read
         '''           
         t_id = transaction.id
-        read_only = transaction.read_only
+        read_only = transaction.snapshot is not None # read-only and optimistic transactions read their snapshot
         start_time = transaction.start_time
+        if transaction.deferred_writes and var in transaction.deferred_writes:
+            self.write_deferred(transaction, var) # the transaction reads its own last write
         if read_only:
-            for name, site in self.sites.items():
-                if site.can_read_read_only(var):
-                    time_list = list(site.variables[var].version_history.keys())
-                    idx = bisect.bisect_left(time_list, start_time)
-                    return (site.variables[var].version_history[time_list[idx-1]], site.name)  
-        for name, site in self.sites.items():
-            if site.can_read(t_id, var):
-                site.acquire_read_lock(t_id, var)
-                return (site.variables[var].val, site.name)
+            snapshot = self.snapshot_view(transaction)
+            cached = snapshot.get(var)
+            if cached is not None:
+                return cached
+        live_sites = self.live_sites
+        replicas = self.replicas.get(var, ())
+        routing = self.read_routing
+        if routing is not None:
+            replicas = routing.order(transaction, replicas)
+        for site, bit in replicas:
+            if not live_sites & bit:
+                continue
+            val = site.read(t_id, var, read_only, start_time)
+            if val is not None:
+                if read_only:
+                    snapshot[var] = (val, site.name)
+                elif routing is not None:
+                    routing.acquired(t_id, site.name, var)
+                return (val, site.name)
         return (None, None) #cannot read bcoz of conflict
+
+    def live_replicas(self, var):
+        '''Returns the names of the available sites holding the variable var, in placement order'''
+        live_sites = self.live_sites
+        return [site.name for site, bit in self.replicas.get(var, ()) if live_sites & bit]
+
+    def buffer_write(self, var):
+        '''Records that an active optimistic transaction buffered a write of var, which catch_up then skips'''
+        buffered = self.buffered_writes
+        buffered[var] = buffered.get(var, 0) + 1
+
+    def release_writes(self, var_names):
+        '''Records that the optimistic transaction which buffered the writes of var_names ended'''
+        buffered = self.buffered_writes
+        for var in var_names:
+            if buffered[var] == 1:
+                del buffered[var]
+            else:
+                buffered[var] -= 1
+
+    def snapshot_view(self, transaction):
+        '''Returns the snapshot view of the read-only transaction, emptied if a failure, recovery or commit
+        since it was filled may change the replica its reads pick
+
+        Parameters:
+            self(SiteManager): instance of the class.
+            transaction(Transaction): a read-only transaction
+        Returns:
+            dict: dictionary of var name and tuple of its value at the snapshot and the site it was read from
+        '''
+        if transaction.snapshot_generation != self.generation:
+            transaction.snapshot.clear()
+            transaction.snapshot_generation = self.generation
+        return transaction.snapshot
+
+    def read_many(self, transaction, var_names):
+        '''Reads the variables var_names at the snapshot of the read-only transaction, with one pass per site
+
+        Parameters:
+            self(SiteManager): instance of the class.
+            transaction(Transaction): a read-only transaction
+            var_names(iterable): names of the variables, ideally in variable order
+        Returns:
+            dict: dictionary of var name and tuple of its value and the site it was read from, in the order of
+            var_names, for the variables a live site can serve. Each is read from the same replica as by read
+        '''
+        snapshot = self.snapshot_view(transaction)
+        var_names = list(var_names)
+        routing = self.read_routing
+        pending = [] # list of var name, its replicas in the order to try and position of the next one to try
+        for var in var_names:
+            if var not in snapshot and var in self.replicas:
+                replicas = self.replicas[var]
+                if routing is not None:
+                    replicas = routing.order(transaction, replicas)
+                pending.append((var, replicas, 0))
+        live_sites = self.live_sites
+        while pending:
+            groups = {} # dict of site and list of var name, replicas and position of the replica after it
+            for var, replicas, i in pending:
+                while i < len(replicas) and not live_sites & replicas[i][1]:
+                    i += 1
+                if i < len(replicas):
+                    groups.setdefault(replicas[i][0], []).append((var, replicas, i + 1))
+            calls = [(site, (transaction.start_time, [entry[0] for entry in entries])) for site, entries in groups.items()]
+            pending = []
+            for (site, entries), values in zip(groups.items(), self.fan_out('read_many', calls)):
+                for (var, replicas, i), val in zip(entries, values):
+                    if val is None:
+                        pending.append((var, replicas, i))
+                    else:
+                        snapshot[var] = (val, site.name)
+        return {var: snapshot[var] for var in var_names if var in snapshot}
         
     def write(self, t_id, var, val):
         '''Writes the variable var with the value val for the given transaction t_id
@@ -283,54 +747,116 @@ class SiteManager:
             var(string): name of the variable whose value is being accessed
             val(int): value to which the variable var needs to be written
         Returns:
-        list: a list of all sites to which var is written
+        list: a list of all sites to which var is written, empty if the write lock is held elsewhere at any of them
         '''          
-        can_write_all = True
+        live_sites = self.live_sites
+        live_replicas = [site for site, bit in self.replicas.get(var, ()) if live_sites & bit]
+        if self.site_processes:
+            calls = [(site, (t_id, var)) for site in live_replicas]
+            if not all(self.fan_out('can_acquire_write_lock', calls)):
+                return []
+            self.fan_out('write', [(site, (t_id, var, val)) for site in live_replicas])
+            if self.read_routing is not None:
+                for site in live_replicas:
+                    self.read_routing.acquired(t_id, site.name, var)
+            return [site.name for site in live_replicas]
+        for site in live_replicas:
+            if not site.can_acquire_write_lock(t_id, var):
+                return []
         sites_written = []
-        for name, site in self.sites.items():
-            if site.can_write(t_id, var):
-                can_write_all = can_write_all and site.can_acquire_write_lock(t_id, var)
-        if can_write_all:
-            for name, site in self.sites.items():
-                if site.can_write(t_id, var):
-                    site.acquire_write_lock(t_id,var)
-                    site.variables[var].val = val
-                    sites_written.append(name)
+        for site in live_replicas:
+            site.write(t_id, var, val)
+            sites_written.append(site.name)
+        if self.read_routing is not None:
+            for site_name in sites_written:
+                self.read_routing.acquired(t_id, site_name, var)
         return sites_written
+
+    def write_deferred(self, transaction, var):
+        '''Writes at its sites the value of var the transaction last wrote, which is only in its write set
+
+        Parameters:
+            self(SiteManager): instance of the class.
+            transaction(Transaction): a transaction that wrote var
+            var(string): name of a variable in the deferred writes of the transaction
+        SideEffect:
+            Removes var from the deferred writes of the transaction. Sites that failed since the write lost
+            its lock and its value, so the value is only written where the transaction still holds the lock
+        '''
+        sites_written, val = transaction.write_set[var]
+        self.fan_out('write_locked', [(site, (transaction.id, var, val)) for site in
+            (self.sites[site_name] for site_name in sites_written) if site.status == Status.AVAILABLE])
+        transaction.deferred_writes.discard(var)
  
-    def commit(self, site_name, t_id, time):
-        '''commit the transaction with id t_id
+    def commit_transaction(self, t_id, site_names, write_set, time, defer_sync=False, locked=True):
+        '''commit the transaction with id t_id at every given site in a single step
 
         Parameters:
             self(SiteManager): instance of the class.
             t_id(string): id of the transaction
-            var(string): name of the variable whose value is being accessed
-            val(int): value to which the variable var needs to be written
+            site_names(iterable): names of the sites accessed by the transaction
+            write_set(dict): dictionary of var name and tuple of the list of sites written and the value
+            time(int): commit time
+            defer_sync(bool): True to leave the sync of the logs to sync_logs, once a group of
+                transactions is committed
+            locked(bool): False for an optimistic transaction, whose buffered writes are committed without locks
         Returns:
-        list: a list of all sites to which var is written
-        '''            
-        if self.sites[site_name].status != Status.AVAILABLE:
-            return
-        for locks in self.sites[site_name].lock_table.values():
-            for lock in locks:
-                if lock.t_id == t_id and lock.lock_type == LockType.WRITE:
-                    #commit the values
-                    self.sites[site_name].variables[lock.var_name].commited_value = self.sites[site_name].variables[lock.var_name].val
-                    self.sites[site_name].variables[lock.var_name].commited_time = time
-                    self.sites[site_name].variables[lock.var_name].readable = True
-                    self.sites[site_name].variables[lock.var_name].version_history[time] = self.sites[site_name].variables[lock.var_name].val
-            locks[:] = [lock for lock in locks if lock.t_id != t_id]
+        list: the sites whose log was written, to pass to sync_logs
+        '''
+        writes = {} # dict of site name and list of var name and value
+        for var_name, (sites_written, val) in write_set.items():
+            for site_name in sites_written:
+                writes.setdefault(site_name, []).append((var_name, val))
+        calls = []
+        for site_name in site_names:
+            site = self.sites[site_name]
+            if site.status == Status.AVAILABLE:
+                calls.append((site, (t_id, writes.get(site_name, ()), time, self.low_watermark, defer_sync, locked)))
+        if self.failed_once:
+            self.generation += 1
+        if self.read_routing is not None:
+            self.read_routing.released(t_id)
+        logged_sites = []
+        metrics = self.metrics
+        for (site, args), (logged, sizes) in zip(calls, self.fan_out('commit', calls)):
+            if logged:
+                logged_sites.append(site)
+            if metrics is not None:
+                for size in sizes:
+                    metrics.observe('version_history_size', size, SIZE_BUCKETS)
+        return logged_sites
+
+    def sync_logs(self, sites):
+        '''Syncs the logs written by a group of commits, once per site
+
+        Parameters:
+            self(SiteManager): instance of the class.
+            sites(iterable): sites returned by commit_transaction
+        '''
+        self.fan_out('sync_log', [(site, ()) for site in sites])
     
+    def set_low_watermark(self, low_watermark):
+        '''Sets the start time of the oldest active read-only transaction and drops the versions it no longer needs
+
+        Parameters:
+            self(SiteManager): instance of the class.
+            low_watermark(int): start time of the oldest active read-only transaction, None if there is none
+        '''
+        advanced = low_watermark is None or (self.low_watermark is not None and low_watermark > self.low_watermark)
+        self.low_watermark = low_watermark
+        if not advanced:
+            return
+        for site in self.sites.values():
+            site.collect(low_watermark)
+
     def dump(self):
         '''Prints the site name and all current committed state of each variable that it contains
 
         Parameters:
             self(SiteManager): instance of the class.        
         '''           
-        for name, site in self.sites.items():
-            var_vals = [var.name +':'+str(var.commited_value) for var in site.variables.values()]
-            string_var_vals = ','.join(var_vals)
-            print(f'{name}: {string_var_vals}')
+        items = self.fan_out('committed_items', [(site, ()) for site in self.sites.values()])
+        self.output.emit('dump', list(zip(self.sites, items)))
 
     def print_lock_table(self, site_name):
         '''Prints the lock table of the give site.
@@ -339,9 +865,7 @@ class SiteManager:
             self(SiteManager): instance of the class. 
             site_name(string): name of the site.      
         '''           
-        for var, locks in self.sites[site_name].lock_table.items():
-            locking_trans = ', '.join([lock.t_id for lock in locks])
-            print(f'{var}: {locking_trans}')
+        self.output.emit('lock_table', self.sites[site_name].lock_items())
 
     def fail(self, site_name):
         '''Fails the given site.
@@ -351,24 +875,33 @@ class SiteManager:
             site_name(string): name of the site.      
         '''         
         self.sites[site_name].fail()
-        print(f'site: {site_name} failed')
+        self.live_sites &= ~self.site_bits[site_name]
+        self.generation += 1
+        self.availability_changes += 1
+        self.failed_once = True
+        if self.read_routing is not None:
+            self.read_routing.failed(site_name)
+        self.output.emit('fail', site_name)
     
-    def abort(self, site_name, t_id, time):
+    def abort_transaction(self, t_id, site_names, write_set):
         '''Aborts the transaction t_id
 
         Parameters:
             self(SiteManager): instance of the class. 
-            site_name(string): name of the site.   
             t_id(string): transaction id
-            time: time of abort
+            site_names(iterable): names of the sites accessed by the transaction
+            write_set(dict): dictionary of var name and tuple of the list of sites written and the value
         SideEffect:
-            Removes all the locks held by transaction t_id at site site_name
+            Removes all the locks held by transaction t_id, and restores the committed value of the
+            variables it wrote at the sites where it still held their locks
         '''         
-        for var in self.sites[site_name].variables.values():
-            if t_id in self.sites[site_name].get_locking_transaction(var.name):
-                var.val = var.commited_value
-        for locks in self.sites[site_name].lock_table.values():
-            locks[:] = [lock for lock in locks if lock.t_id != t_id]
+        written = {} # dict of site name and list of var names
+        for var_name, (sites_written, val) in write_set.items():
+            for site_name in sites_written:
+                written.setdefault(site_name, []).append(var_name)
+        self.fan_out('abort', [(self.sites[site_name], (t_id, written.get(site_name, ()))) for site_name in site_names])
+        if self.read_routing is not None:
+            self.read_routing.released(t_id)
 
     def recover(self, site_name):
         '''Recovers the given failed site
@@ -377,8 +910,84 @@ class SiteManager:
             self(SiteManager): instance of the class. 
             site_name(string): name of the site.   
         '''          
-        self.sites[site_name].recover()
-        print(f'site: {site_name} recovers')
+        self.sites[site_name].recover(self.low_watermark)
+        self.live_sites |= self.site_bits[site_name]
+        self.generation += 1
+        self.availability_changes += 1
+        if self.catch_up_batch is not None:
+            now = self.metrics.now if self.metrics is not None else 0
+            self.catching_up[site_name] = [0, [], now, clock.perf_counter()]
+        self.output.emit('recover', site_name)
+
+    def catch_up(self):
+        '''Copies a batch of the latest committed versions of the unreadable replicated variables of each
+        recovered site from a live replica, and makes them readable there
+
+        Parameters:
+            self(SiteManager): instance of the class.
+        SideEffect:
+            Variables write-locked by an active transaction or buffered by an active optimistic one, or
+            without a readable live replica, are copied again in a later batch. A site leaves the catch-up
+            once all its variables are readable
+        '''
+        metrics = self.metrics
+        buffered = self.buffered_writes
+        installed_any = False
+        for site_name, state in list(self.catching_up.items()):
+            site = self.sites[site_name]
+            if site.status != Status.AVAILABLE:
+                del self.catching_up[site_name] # restarted by the next recovery
+                continue
+            position, retry, start_tick, start_time = state
+            names, state[0] = site.unreadable_replicated(position, self.catch_up_batch)
+            names = retry + names
+            pending = [(var, 0) for var in names if var not in buffered]
+            # the commit of a buffered write may skip this replica, so it is copied after that commit
+            state[1] = retry = [var for var in names if var in buffered]
+            versions = {}
+            live_sites = self.live_sites & ~self.site_bits[site_name]
+            while pending:
+                groups = {} # dict of source site and list of var name and position of the replica after it
+                for var, i in pending:
+                    replicas = self.replicas[var]
+                    while i < len(replicas) and not live_sites & replicas[i][1]:
+                        i += 1
+                    if i < len(replicas):
+                        groups.setdefault(replicas[i][0], []).append((var, i + 1))
+                    else:
+                        retry.append(var) # no readable live replica yet
+                calls = [(source, ([var for var, i in entries],)) for source, entries in groups.items()]
+                pending = []
+                for entries, (source_versions, locked) in zip(groups.values(), self.fan_out('export_versions', calls)):
+                    versions.update(source_versions)
+                    retry.extend(locked)
+                    pending.extend((var, i) for var, i in entries if var not in source_versions and var not in locked)
+            installed = []
+            if versions:
+                installed, locked = site.import_versions(versions, self.low_watermark)
+                retry.extend(locked)
+            if installed:
+                installed_any = True
+            if metrics is not None:
+                labels = (('site', site_name),)
+                metrics.inc('catch_up_batches_total', labels)
+                metrics.inc('catch_up_variables_total', labels, len(installed))
+            if state[0] >= self.site_sizes[site_name] and not retry:
+                del self.catching_up[site_name]
+                if metrics is not None:
+                    metrics.observe('rejoin_ticks', metrics.now - start_tick, TICK_BUCKETS)
+                    metrics.observe('rejoin_seconds', clock.perf_counter() - start_time, LONG_SECOND_BUCKETS)
+        if installed_any:
+            self.generation += 1
+
+    def close(self):
+        '''Syncs and closes the logs and stores of the sites, and stops their worker processes
+
+        Parameters:
+            self(SiteManager): instance of the class.
+        '''
+        for site in self.sites.values():
+            site.close()
     
     def get_locking_transaction(self, var):
         '''Method to get all the transactions that hold lock on variable var.
@@ -390,7 +999,13 @@ class SiteManager:
             set: a set of transactions that has lock on the given variable
         '''           
         t_ids = set()
-        for site in self.sites.values():
+        replicas = self.replicas.get(var, ())
+        if self.site_processes:
+            holders = self.fan_out('holders', [(site, (var,)) for site, bit in replicas])
+            for site_holders in holders:
+                t_ids.update(set(site_holders))
+            return t_ids
+        for site, bit in replicas:
             t_ids.update(site.get_locking_transaction(var))
         return t_ids
 
@@ -416,4 +1031,16 @@ class SiteManager:
         '''   
         return self.sites[site_name].get_locking_transaction_on_site()
 
+    def get_locked_variables(self, site_name, t_id=None):
+        '''Method to get the variables locked at the given Site, by t_id if given otherwise by any transaction.
+
+        Parameters:
+            self(SiteManager): instance of the class.
+            site_name(string): name of the site
+            t_id(string): name of the transaction
+        Returns:
+            list: a list of locked variable names
+        '''
+        return self.sites[site_name].get_locked_variables(t_id)
+
 
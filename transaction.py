@@ -1,6 +1,9 @@
 class Transaction:
     '''Data Model for the Transaction'''
-    def __init__(self, id, status, start_time, read_only = False):
+    __slots__ = ('id', 'status', 'start_time', 'read_only', 'optimistic', 'sites_accessed', 'read_set', 'write_set',
+        'snapshot', 'snapshot_generation', 'held_writes', 'deferred_writes')
+
+    def __init__(self, id, status, start_time, read_only = False, optimistic = False):
         '''creates and initialises a new transaction
 
         Parameters:
@@ -8,6 +11,8 @@ class Transaction:
         status(TransactionStatus): current status of the Transaction
         start_time(int): time at which the transaction started
         read_only(bool): True if transaction is read-only otherwise False
+        optimistic(bool): True if the read-write transaction reads its snapshot without locks, buffers its
+            writes and is validated when it ends
 
         Returns:
         Transaction: a new transaction object initialized with the given values
@@ -16,4 +21,16 @@ class Transaction:
         self.status = status
         self.start_time = start_time
         self.read_only = read_only
+        self.optimistic = optimistic
         self.sites_accessed = set()
+        self.read_set = {} # dict of var name and name of the site it was read from
+        self.write_set = {} # dict of var name and tuple of the list of sites written and the buffered value
+        # dict of var name and tuple of the value at the snapshot and the site it was read from,
+        # for the read-only and optimistic transactions, which read the snapshot at their start time
+        self.snapshot = {} if read_only or optimistic else None
+        self.snapshot_generation = 0 # generation of the site manager the snapshot entries are valid for
+        # dict of var name and availability changes of the site manager when the transaction got the write
+        # locks of var on all its live replicas, which it still holds while no site failed or recovered
+        self.held_writes = {}
+        # var names whose last written value is only in the write set, not yet written at their sites
+        self.deferred_writes = set()
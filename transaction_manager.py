@@ -1,24 +1,64 @@
 from transaction import Transaction
 from trans_status import TransactionStatus
+import time as clock
 from collections import deque, defaultdict
 from instruction import Instruction
 from instruction_type import InstructionType
 from site_manager import SiteManager
+from placement import consistent_hash_placement
+from wait_for_graph import WaitForGraph
+from wait_queue import WaitQueues
+from output_sink import OutputSink
+from metrics import TICK_BUCKETS, SECOND_BUCKETS, SIZE_BUCKETS
 
 
 class TransactionManager:
     '''class that manages all the transactions'''
-    def __init__(self):
+    def __init__(self, output=None, num_site=10, num_var=20, replication_factor=None, metrics=None, wal=None,
+            store_dir=None, site_processes=False, catch_up_batch=None, read_routing=None, deadlock_prevention=None,
+            optimistic=False):
         '''creates and initialises a new Transaction Manager
         Parameters:
             self(TransactionManager): instance of the class
+            output(OutputSink): sink for the output messages, prints them if None
+            num_site(int): number of sites
+            num_var(int): number of variables
+            replication_factor(int): number of sites holding each variable, placed by consistent hashing.
+                If None even variables are on every site and odd ones on a single site
+            metrics(Metrics): metrics to record, or None to record nothing
+            wal(WriteAheadLog): settings of the write-ahead logs of the sites, None to keep the data only in memory
+            store_dir(string): directory of the memory-mapped stores of the committed values, None to keep them in memory
+            site_processes(bool): True to run each site in its own worker process
+            catch_up_batch(int): number of variables of each recovered site checked per operation by the
+                catch-up, None to leave replicated variables unreadable there until their next commit
+            read_routing(ReadRouting): policy choosing the replica of each read, None to read from the first
+                live replica in placement order
+            deadlock_prevention(string): 'wait-die' or 'wound-wait' to prevent deadlocks by the start times of the
+                transactions, None to detect them on the wait-for graph
+            optimistic(bool): True to run the read-write transactions optimistically. They read the snapshot at
+                their start time without locks, buffer their writes and are validated when they end
         Returns:
             TransactionManager: a new TransactionManager object initialized with the given values
         '''          
+        self.output = output if output is not None else OutputSink()
+        self.metrics = metrics
         self.transaction_map = defaultdict(Transaction)
-        self.remaining_instructions = []
-        self.site_manager = SiteManager(10, 20)
-        self.wait_for_graph = defaultdict(set)
+        self.wait_queues = WaitQueues()
+        placement = None
+        if replication_factor is not None:
+            placement = consistent_hash_placement(num_site, num_var, replication_factor)
+        self.site_manager = SiteManager(num_site, num_var, self.output, placement, metrics, wal, store_dir,
+            site_processes, catch_up_batch, read_routing)
+        self.wait_for_graph = WaitForGraph() # only searched for cycles when deadlocks are detected
+        # t_ids whose instruction is blocked behind another transaction, which tells a lock wait from a wait
+        # for a failed site when deadlocks are prevented
+        self.lock_waiters = set()
+        self.deadlock_prevention = deadlock_prevention
+        self.optimistic = optimistic
+        self.last_commit = {} # dict of var name and time of its last commit, to validate optimistic transactions
+        # dict of active read-only or optimistic t_id and start time, in start order
+        self.snapshot_transactions = {}
+        self.site_transactions = defaultdict(set) # dict of site name and set of active t_ids that accessed it
 
     def begin(self, t_id, time):
         '''Begins a new transaction with transaction id, t_id at time, time.
@@ -29,9 +69,13 @@ class TransactionManager:
         SideEffect:
             creates a new transaction and adds it to the transaction_map
         '''           
-        transaction = Transaction(t_id, TransactionStatus.READY, time)
+        transaction = Transaction(t_id, TransactionStatus.READY, time, optimistic=self.optimistic)
         self.transaction_map[t_id] = transaction
-        print(f'{t_id} begins')
+        if self.optimistic:
+            self.snapshot_transactions.pop(t_id, None)
+            self.snapshot_transactions[t_id] = time
+            self.update_low_watermark()
+        self.output.emit('begin', t_id)
 
     def beginRO(self, t_id, time):
         '''Begins a new read-only transaction with transaction id, t_id at time, time.
@@ -44,7 +88,10 @@ class TransactionManager:
         '''          
         transaction = Transaction(t_id, TransactionStatus.READY, time, True)
         self.transaction_map[t_id] = transaction
-        print(f'Read Only {t_id} begins')
+        self.snapshot_transactions.pop(t_id, None)
+        self.snapshot_transactions[t_id] = time
+        self.update_low_watermark()
+        self.output.emit('begin_read_only', t_id)
 
     def read(self, t_id, var, time):
         '''Reads the value of the var for transaction, t_id at time, time.
@@ -58,33 +105,81 @@ class TransactionManager:
             If variable cannot be read due to lock conflicts then blocks it and add to waiting instructions.
             Updates wait-for graph
         '''           
+        if self.metrics is not None:
+            self.metrics.tick(time)
+        if self.site_manager.catching_up:
+            self.site_manager.catch_up()
         if t_id not in self.transaction_map:
-            print(f'{t_id} transaction is not yet started')
+            self.output.emit('not_started', t_id)
             return
-        instruction = Instruction(t_id, InstructionType.READ, var, None, time)
         transaction = self.transaction_map[t_id]
+        if transaction.optimistic:
+            self.read_optimistic(transaction, var, time)
+            return
         conflicting_transaction = self.check_conflict_in_remaining_instructions(t_id,
-            instruction)
+            InstructionType.READ, var, time)
         if conflicting_transaction == None:
             val, site = self.site_manager.read(transaction, var)
             if site is not None:
                 if transaction.status != TransactionStatus.ABORTED:
                     transaction.status = TransactionStatus.RUNNING
-                self.transaction_map[t_id].sites_accessed.add(site)
-                print(
-                    f'{t_id} accessed {var} from the site: {site} having value: {val}')
+                self.wait_queues.wake_transaction(t_id)
+                self.lock_waiters.discard(t_id)
+                transaction.sites_accessed.add(site)
+                transaction.read_set[var] = site
+                self.site_transactions[site].add(t_id)
+                self.output.emit('read', t_id, var, site, val)
+                if self.metrics is not None and not transaction.read_only:
+                    self.metrics.inc('read_locks_total', (('site', site),))
                 return
             else:
                 self.update_wait_for_graph_with_executing_transaction(
                     t_id, var)
+                self.wake_if_blocked_by_failure(t_id, var)
         else:
             self.update_wait_for_graph(t_id, conflicting_transaction)
         if transaction.status != TransactionStatus.BLOCKED and transaction.status != TransactionStatus.ABORTED:
-            self.remaining_instructions.append(instruction)
+            self.wait_queues.enqueue(Instruction(t_id, InstructionType.READ, var, None, time), transaction.read_only)
             transaction.status = TransactionStatus.BLOCKED
-            print(f'Blocked transaction: {t_id}')
-        self.detect_and_handle_deadlock(t_id)
+            self.output.emit('blocked', t_id)
+            if self.metrics is not None:
+                self.metrics.inc('blocked_total')
+        if self.deadlock_prevention is None:
+            self.detect_and_handle_deadlock(t_id)
+        else:
+            self.prevent_deadlock(t_id, var, conflicting_transaction, time)
 
+    def read_snapshot(self, t_id, var_names, time):
+        '''Reads many variables at the snapshot of the read-only transaction t_id at time, time.
+        Parameters:
+            self(TransactionManager): instance of the class
+            t_id(string): transaction id of a read-only transaction
+            var_names(iterable): names of the variables, such as a range of them in variable order
+            time(int): time of instruction
+        Returns:
+            dict: dictionary of var name and value read, in the order of var_names. Variables no live site
+            can serve are left out and nothing is queued for them, so the caller reads them with read to wait
+        SideEffect:
+            Prints each value read as read does, reading it from the same site
+        '''
+        if self.metrics is not None:
+            self.metrics.tick(time)
+        if t_id not in self.transaction_map:
+            self.output.emit('not_started', t_id)
+            return {}
+        transaction = self.transaction_map[t_id]
+        if not transaction.read_only:
+            raise ValueError(f'{t_id} is not a read-only transaction')
+        values = {}
+        for var, (val, site) in self.site_manager.read_many(transaction, var_names).items():
+            if transaction.status != TransactionStatus.ABORTED:
+                transaction.status = TransactionStatus.RUNNING
+            transaction.sites_accessed.add(site)
+            transaction.read_set[var] = site
+            self.site_transactions[site].add(t_id)
+            self.output.emit('read', t_id, var, site, val)
+            values[var] = val
+        return values
 
     def write(self, t_id, var, val, time):
         '''Write the var with value, val for transaction, t_id at time, time.
@@ -97,34 +192,166 @@ class TransactionManager:
         SideEffect:
             Write value, val to the variable, var.
             If variable cannot be written due to lock conflicts,then  blocks it and add to waiting instructions.
-            Updates the wait-for graph
+            Updates the wait-for graph.
+            A repeated write of a variable whose write locks are still held is only buffered in the write set
         '''             
+        if self.metrics is not None:
+            self.metrics.tick(time)
+        if self.site_manager.catching_up:
+            self.site_manager.catch_up()
         if t_id not in self.transaction_map:
-            print(f'{t_id} transaction is not yet started')
+            self.output.emit('not_started', t_id)
             return
-        instruction = Instruction(t_id, InstructionType.WRITE, var, val, time)
         transaction = self.transaction_map[t_id]
+        if transaction.optimistic:
+            self.write_optimistic(transaction, var, val, time)
+            return
         conflicting_transaction = self.check_conflict_in_remaining_instructions(
-            t_id, instruction)
-        if conflicting_transaction == None or len(self.wait_for_graph[conflicting_transaction]) == 0: #write allowed if conflict is due to read after recovery
+            t_id, InstructionType.WRITE, var, time)
+        if (conflicting_transaction == None and transaction.status != TransactionStatus.ABORTED
+                and transaction.held_writes.get(var) == self.site_manager.availability_changes):
+            # the transaction still holds the write locks of var on all its live replicas, so the
+            # write is granted without asking the sites, which are written when it reads var back
+            sites_written = transaction.write_set[var][0]
+            transaction.status = TransactionStatus.RUNNING
+            self.wait_queues.wake_transaction(t_id)
+            transaction.write_set[var] = (sites_written, val)
+            transaction.deferred_writes.add(var)
+            self.output.emit('write', t_id, var, sites_written, val)
+            if self.metrics is not None:
+                self.metrics.observe('write_fanout', len(sites_written), SIZE_BUCKETS)
+            return
+        if conflicting_transaction == None or not self.waits_for_transaction(conflicting_transaction): #write allowed if conflict is due to read after recovery
             sites_written = self.site_manager.write(t_id, var, val)
             if len(sites_written) > 0:
                 if transaction.status != TransactionStatus.ABORTED:
                     transaction.status = TransactionStatus.RUNNING
-                self.transaction_map[t_id].sites_accessed.update(sites_written)
-                print(
-                    f'{t_id} wrote {var} to the sites: {sites_written} with value: {val}')
+                self.wait_queues.wake_transaction(t_id)
+                self.lock_waiters.discard(t_id)
+                transaction.sites_accessed.update(sites_written)
+                transaction.write_set[var] = (sites_written, val)
+                transaction.held_writes[var] = self.site_manager.availability_changes
+                transaction.deferred_writes.discard(var)
+                for site in sites_written:
+                    self.site_transactions[site].add(t_id)
+                self.output.emit('write', t_id, var, sites_written, val)
+                if self.metrics is not None:
+                    self.metrics.observe('write_fanout', len(sites_written), SIZE_BUCKETS)
                 return
             else:
+                conflicting_transaction = None # waits for the locks on var
                 self.update_wait_for_graph_with_executing_transaction(
                     t_id, var)
+                self.wake_if_blocked_by_failure(t_id, var)
         else:
             self.update_wait_for_graph(t_id, conflicting_transaction)
         if transaction.status != TransactionStatus.BLOCKED and transaction.status != TransactionStatus.ABORTED:
-            self.remaining_instructions.append(instruction)
+            self.wait_queues.enqueue(Instruction(t_id, InstructionType.WRITE, var, val, time))
             transaction.status = TransactionStatus.BLOCKED
-            print(f'Blocked transaction: {t_id}')  
-        self.detect_and_handle_deadlock(t_id)
+            self.output.emit('blocked', t_id)
+            if self.metrics is not None:
+                self.metrics.inc('blocked_total')
+        if self.deadlock_prevention is None:
+            self.detect_and_handle_deadlock(t_id)
+        else:
+            self.prevent_deadlock(t_id, var, conflicting_transaction, time)
+
+    def read_optimistic(self, transaction, var, time):
+        '''Reads the value of the var for the optimistic transaction at time, time, without a lock.
+        Parameters:
+            self(TransactionManager): instance of the class
+            transaction(Transaction): an optimistic transaction
+            var(string): name of the variable
+            time(int): time of instruction
+        SideEffect:
+            Prints the value the transaction buffered for var, or else the value of var at its snapshot.
+            Waits, like a read-only read, if no live site can serve the snapshot
+        '''
+        t_id = transaction.id
+        buffered = transaction.write_set.get(var)
+        if buffered is not None:
+            sites_written, val = buffered
+            site = sites_written[0]
+        else:
+            val, site = self.site_manager.read(transaction, var)
+        if site is not None:
+            if transaction.status != TransactionStatus.ABORTED:
+                transaction.status = TransactionStatus.RUNNING
+            self.wait_queues.wake_transaction(t_id)
+            if buffered is None:
+                transaction.sites_accessed.add(site)
+                transaction.read_set[var] = site
+                self.site_transactions[site].add(t_id)
+            self.output.emit('read', t_id, var, site, val)
+            return
+        self.wait_optimistic(transaction, Instruction(t_id, InstructionType.READ, var, None, time))
+
+    def write_optimistic(self, transaction, var, val, time):
+        '''Buffers the write of the var with value, val for the optimistic transaction at time, time.
+        Parameters:
+            self(TransactionManager): instance of the class
+            transaction(Transaction): an optimistic transaction
+            var(string): name of the variable
+            val(string): value to be written
+            time(int): time of instruction
+        SideEffect:
+            The value is committed when the transaction ends, at the sites holding var that are available
+            now, and a failure of any of them aborts the transaction. Waits if none of them is available
+        '''
+        t_id = transaction.id
+        sites_written = self.site_manager.live_replicas(var)
+        if sites_written:
+            if transaction.status != TransactionStatus.ABORTED:
+                transaction.status = TransactionStatus.RUNNING
+            self.wait_queues.wake_transaction(t_id)
+            transaction.sites_accessed.update(sites_written)
+            if var not in transaction.write_set:
+                self.site_manager.buffer_write(var)
+            transaction.write_set[var] = (sites_written, val)
+            for site in sites_written:
+                self.site_transactions[site].add(t_id)
+            self.output.emit('write', t_id, var, sites_written, val)
+            if self.metrics is not None:
+                self.metrics.observe('write_fanout', len(sites_written), SIZE_BUCKETS)
+            return
+        self.wait_optimistic(transaction, Instruction(t_id, InstructionType.WRITE, var, val, time))
+
+    def wait_optimistic(self, transaction, instruction):
+        '''Queues the instruction of the optimistic transaction until a site that can serve it recovers.
+        Parameters:
+            self(TransactionManager): instance of the class
+            transaction(Transaction): an optimistic transaction
+            instruction(Instruction): its read or write that no live site can serve
+        SideEffect:
+            The queue of the variable is retried on every pass. Optimistic transactions hold no locks,
+            so they only wait for failed sites and never deadlock
+        '''
+        self.wait_queues.wake((instruction.var,))
+        if transaction.status != TransactionStatus.BLOCKED and transaction.status != TransactionStatus.ABORTED:
+            self.wait_queues.enqueue(instruction, True)
+            transaction.status = TransactionStatus.BLOCKED
+            self.output.emit('blocked', transaction.id)
+            if self.metrics is not None:
+                self.metrics.inc('blocked_total')
+
+    def validate(self, transaction):
+        '''Validates the optimistic transaction before its commit.
+        Parameters:
+            self(TransactionManager): instance of the class
+            transaction(Transaction): an optimistic transaction
+        Returns:
+            bool: True if no transaction committed a variable it read or wrote since it began. Its reads
+            then still hold at its commit, so the optimistic transactions are serializable in commit order
+        '''
+        last_commit = self.last_commit
+        start_time = transaction.start_time
+        for var in transaction.read_set:
+            if last_commit.get(var, 0) > start_time:
+                return False
+        for var in transaction.write_set:
+            if last_commit.get(var, 0) > start_time:
+                return False
+        return True
 
     def end(self, t_id, time): 
         '''Ends the transaction t_id, either commits or aborts. Thereafter process remaining instructions
@@ -133,13 +360,42 @@ class TransactionManager:
             t_id(string): transaction id
             time(int): time of instruction
         '''                 
-        if t_id in self.transaction_map:
-            if self.transaction_map[t_id].status == TransactionStatus.ABORTED:
-                print(f'Transaction:{t_id} aborts due to previous access to failed site')
-                self.abort(t_id, time)
-            else:
-                self.commit(t_id, time)
+        self.end_group((t_id,), time)
+
+    def end_group(self, t_ids, time):
+        '''Ends the transactions t_ids at the same time, time, as one group. Thereafter process remaining instructions
+        Parameters:
+            self(TransactionManager): instance of the class
+            t_ids(iterable): transaction ids, ended in the given order
+            time(int): time of instruction
+        SideEffect:
+            The site logs written by the commits of the group are synced once, after all of them
+        '''
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.tick(time)
+            passes = metrics.value('retry_passes_total')
+        if self.site_manager.catching_up:
+            self.site_manager.catch_up()
+        logs = set()
+        for t_id in t_ids:
+            if t_id in self.transaction_map:
+                if self.transaction_map[t_id].status == TransactionStatus.ABORTED:
+                    self.output.emit('abort_failed_site', t_id)
+                    if metrics is not None:
+                        metrics.inc('aborts_total', (('reason', 'failed_site'),))
+                    self.abort(t_id, time)
+                elif self.transaction_map[t_id].optimistic and not self.validate(self.transaction_map[t_id]):
+                    self.output.emit('validation', t_id)
+                    if metrics is not None:
+                        metrics.inc('aborts_total', (('reason', 'validation'),))
+                    self.abort(t_id, time)
+                else:
+                    logs.update(self.commit(t_id, time, True))
+        self.site_manager.sync_logs(logs)
         self.process_remaining_instructions()
+        if metrics is not None:
+            metrics.observe('retry_passes_per_end', metrics.value('retry_passes_total') - passes, SIZE_BUCKETS)
 
     def abort(self, t_id, time):
         '''Abort the transaction. Thereafter process remaining instructions
@@ -150,29 +406,92 @@ class TransactionManager:
         SideEffect:
             Removes the transaction, t_id from the transaction_map
         '''         
-        sites_accessed = self.transaction_map[t_id].sites_accessed
-        for site in sites_accessed:
-            self.site_manager.abort(site, t_id, time)
+        transaction = self.transaction_map[t_id]
+        self.wake_waiters(t_id)
+        self.site_manager.abort_transaction(t_id, transaction.sites_accessed, transaction.write_set)
+        if transaction.optimistic:
+            self.site_manager.release_writes(transaction.write_set)
         self.transaction_map.pop(t_id)
+        self.forget_sites_accessed(t_id, transaction.sites_accessed)
+        self.end_snapshot(t_id)
         self.remove_transaction_from_wait_for_graph(t_id)
-        print(f'Transaction:{t_id} aborts')
+        self.wait_queues.remove_transaction(t_id)
+        self.output.emit('abort', t_id)
         self.process_remaining_instructions()
 
-    def commit(self, t_id, time):
+    def commit(self, t_id, time, defer_sync=False):
         '''Commit the transaction. Thereafter process remaining instructions
         Parameters:
             self(TransactionManager): instance of the class
             t_id(string): transaction id
             time(int): time of instruction
+            defer_sync(bool): True to leave the sync of the site logs to the caller
+        Returns:
+            list: the sites whose log was written by the commit
         SideEffect:
             Removes the transaction, t_id from the transaction_map
         '''            
-        sites_accessed = self.transaction_map[t_id].sites_accessed
-        for site in sites_accessed:
-            self.site_manager.commit(site, t_id, time)
+        transaction = self.transaction_map[t_id]
+        self.wake_waiters(t_id)
+        logs = self.site_manager.commit_transaction(t_id, transaction.sites_accessed, transaction.write_set,
+            time, defer_sync, not transaction.optimistic)
+        if transaction.optimistic:
+            for var in transaction.write_set:
+                self.last_commit[var] = time
+            self.site_manager.release_writes(transaction.write_set)
         self.transaction_map.pop(t_id)
+        self.forget_sites_accessed(t_id, transaction.sites_accessed)
+        self.end_snapshot(t_id)
         self.remove_transaction_from_wait_for_graph(t_id)
-        print(f'commited {t_id}')
+        self.wait_queues.remove_transaction(t_id)
+        self.output.emit('commit', t_id)
+        if self.metrics is not None:
+            self.metrics.inc('commits_total')
+            self.metrics.observe('commit_fanout', len(transaction.sites_accessed), SIZE_BUCKETS)
+        return logs
+
+    def forget_sites_accessed(self, t_id, sites_accessed):
+        '''Removes the ended transaction t_id from the index of the transactions that accessed each site.
+
+        Parameters:
+            self(TransactionManager): instance of the class
+            t_id(string): transaction id
+            sites_accessed(set): names of the sites accessed by t_id
+        '''
+        for site in sites_accessed:
+            t_ids = self.site_transactions.get(site)
+            if t_ids is not None:
+                t_ids.discard(t_id)
+
+    def is_waiting(self, t_id):
+        '''Returns True if the transaction t_id has an instruction queued, waiting to be granted.
+
+        Parameters:
+            self(TransactionManager): instance of the class
+            t_id(string): transaction id
+        '''
+        return t_id in self.transaction_map and t_id in self.wait_queues.queued_vars
+
+    def end_snapshot(self, t_id):
+        '''Forgets the snapshot of t_id if it is a read-only or optimistic transaction.
+
+        Parameters:
+            self(TransactionManager): instance of the class
+            t_id(string): transaction id
+        '''
+        if self.snapshot_transactions.pop(t_id, None) is not None:
+            self.update_low_watermark()
+
+    def update_low_watermark(self):
+        '''Passes the start time of the oldest active read-only or optimistic transaction to the site manager.
+
+        Parameters:
+            self(TransactionManager): instance of the class
+        SideEffect:
+            Versions older than the snapshot of every active read-only transaction are dropped
+        '''
+        low_watermark = next(iter(self.snapshot_transactions.values()), None)
+        self.site_manager.set_low_watermark(low_watermark)
 
     def dump(self):
         '''Print the current state of sites and committed variables. 
@@ -181,62 +500,168 @@ class TransactionManager:
         '''          
         self.site_manager.dump()
 
-    def fail(self, site):
+    def close(self):
+        '''Syncs and closes the write-ahead logs and stores of the sites, if any
+
+        Parameters:
+            self(TransactionManager): instance of the class
+        '''
+        self.site_manager.close()
+
+    def fail(self, site, time=None):
         '''Fails the given site. If a transaction has accessed this site it is marked as Aborted.
 
         Parameters:
             self(TransactionManager): instance of the class. 
             site_name(string): name of the site.      
+            time(int): time of the failure, None to leave the clock of the metrics where it is
         '''            
+        if self.metrics is not None and time is not None:
+            self.metrics.tick(time)
+        self.wait_queues.wake(self.site_manager.get_locked_variables(site))
         self.site_manager.fail(site)
-        for k, transaction in self.transaction_map.items():
-            if site in transaction.sites_accessed:
+        for t_id in self.site_transactions.pop(site, ()):
+            transaction = self.transaction_map.get(t_id)
+            if transaction is not None and site in transaction.sites_accessed: # t_id may have begun again
                 transaction.status = TransactionStatus.ABORTED
+                self.wait_queues.wake_transaction(t_id)
 
-    def recover(self, site):
+    def recover(self, site, time=None):
         '''Recovers the given failed site
 
         Parameters:
             self(TransactionManager): instance of the class. 
             site_name(string): name of the site.   
+            time(int): time of the recovery, from which the catch-up of the site is timed, None for the
+                latest time seen
         '''          
+        if self.metrics is not None and time is not None:
+            self.metrics.tick(time)
         self.site_manager.recover(site)
 
     def process_remaining_instructions(self):
         '''Process the remaining instructions in blocked state.
         Parameters:
             self(TransactionManager): instance of the class. 
+        Returns:
+            int: number of instructions that left the queues
         SideEffect:
-            Process the remaining instructions that can be processed, and keep other in the list  
+            Retries, in arrival order, the instructions queued on the woken variables up to the first one
+            still blocked in each queue, and keeps the ones that are still blocked in their queues
         '''           
-        rem_inst = []
-        for inst in self.remaining_instructions:
-            if inst.t_id in self.transaction_map:
-                if inst.type == InstructionType.READ:
-                    self.read(inst.t_id, inst.var, inst.time)
-                elif inst.type == InstructionType.WRITE:
-                    self.write(inst.t_id, inst.var, inst.val, inst.time)
-                if self.transaction_map[inst.t_id].status == TransactionStatus.BLOCKED:
-                    rem_inst.append(inst)
-        self.remaining_instructions = rem_inst
-
-    def check_conflict_in_remaining_instructions(self, t_id, instruction):
+        retried, finished = self.wait_queues.run_pass(self.retry_instruction)
+        if self.metrics is not None:
+            self.metrics.inc('retry_passes_total')
+            self.metrics.observe('retried_instructions', retried, SIZE_BUCKETS)
+        return finished
+
+    def retry_instruction(self, inst):
+        '''Retries the blocked instruction inst.
+        Parameters:
+            self(TransactionManager): instance of the class. 
+            inst(Instruction): a queued instruction
+        Returns:
+            bool: True if the instruction leaves its queue, as it was granted or its transaction ended, False
+            if it still waits for another transaction and None if it only waits for failed sites
+        '''
+        if inst.t_id not in self.transaction_map:
+            return True
+        if inst.type == InstructionType.READ:
+            self.read(inst.t_id, inst.var, inst.time)
+        elif inst.type == InstructionType.WRITE:
+            self.write(inst.t_id, inst.var, inst.val, inst.time)
+        transaction = self.transaction_map.get(inst.t_id)
+        if transaction is not None and transaction.status == TransactionStatus.BLOCKED:
+            return False if self.waits_for_transaction(inst.t_id) else None
+        metrics = self.metrics
+        if metrics is not None and transaction is not None:
+            labels = (('var', inst.var),)
+            metrics.inc('lock_waits_total', labels)
+            metrics.inc('lock_wait_ticks_total', labels, metrics.now - inst.time)
+            metrics.observe('lock_wait_ticks', metrics.now - inst.time, TICK_BUCKETS)
+        return True
+
+    def settle(self):
+        '''Retries the woken wait queues until a pass neither grants nor aborts anything.
+
+        Parameters:
+            self(TransactionManager): instance of the class. 
+        SideEffect:
+            A pass that grants an instruction, or aborts a transaction to break or prevent a deadlock,
+            wakes the queues behind it for the next pass. A script always brings a next end to run it,
+            but clients that all wait for a reply do not
+        '''
+        while self.wait_queues.woken or self.wait_queues.rechecks:
+            active = len(self.transaction_map)
+            if not self.process_remaining_instructions() and len(self.transaction_map) == active:
+                break
+
+    def wake_waiters(self, t_id):
+        '''Wakes the wait queues that can make progress once the transaction t_id ends.
+
+        Parameters:
+            self(TransactionManager): instance of the class. 
+            t_id(string): transaction id of the ending transaction
+        SideEffect:
+            Wakes the queues of the variables t_id holds locks on or waits for, and has the instructions
+            of transactions waiting for t_id retried, even behind an instruction that is still blocked
+        '''
+        for site in self.transaction_map[t_id].sites_accessed:
+            self.wait_queues.wake(self.site_manager.get_locked_variables(site, t_id))
+        self.wait_queues.wake_transaction(t_id)
+        for waiting_t_id in self.wait_for_graph.reverse_edges.get(t_id, ()):
+            self.wait_queues.recheck(waiting_t_id)
+
+    def wake_if_blocked_by_failure(self, t_id, var):
+        '''Wakes the wait queue of var if t_id is blocked on it by unavailable sites rather than by locks.
+
+        Parameters:
+            self(TransactionManager): instance of the class. 
+            t_id(string): transaction id of the blocked instruction
+            var(string): variable name
+        SideEffect:
+            The queue of var is retried on every pass, as a recovery or commit elsewhere may unblock it
+        '''
+        t_ids = self.site_manager.get_locking_transaction(var)
+        t_ids.discard(t_id)
+        if not t_ids:
+            self.wait_queues.wake((var,))
+
+    def check_conflict_in_remaining_instructions(self, t_id, ins_type, var, time):
         '''Check conflicts of the current t_id with the already remaining instructions
         Parameters:
             self(TransactionManager): instance of the class. 
             t_id(string): transaction id of the instruction
-            instruction(Instruction): Instruction object containing all the information regarding the instruction
+            ins_type(InstructionType): type of the instruction i.e READ, WRITE
+            var(string): variable the instruction applies to
+            time(int): time when the instruction was issued
         Returns:
             transaction id of conflicting instruction
         '''          
-        if not self.transaction_map[t_id].read_only:
-            for inst in reversed(self.remaining_instructions):
-                if inst.time >= instruction.time:
-                    continue
-                elif inst.t_id != instruction.t_id and inst.var == instruction.var:
-                    if (instruction.type == InstructionType.WRITE) or (instruction.type == InstructionType.READ and inst.type == InstructionType.WRITE):
-                        return inst.t_id
-        return None
+        if self.transaction_map[t_id].read_only:
+            return None
+        queue = self.wait_queues.get_queue(var)
+        if not queue:
+            return None
+        transaction_map = self.transaction_map
+        if queue[-1][1].time < time:
+            # a new instruction waits behind the last instruction queued by another active transaction,
+            # or a read behind the last such write, found from the tail without walking the queue
+            entries = queue if ins_type == InstructionType.WRITE else self.wait_queues.get_writes(var)
+            for arrival, inst in reversed(entries):
+                if inst.t_id != t_id and inst.t_id in transaction_map:
+                    return inst.t_id
+            return None
+        # a retried instruction only waits for the ones queued before it, which are few, as a pass stops
+        # each queue at its first instruction still blocked
+        conflicting = None
+        for arrival, inst in queue:
+            if inst.time >= time:
+                break
+            if inst.t_id != t_id and inst.t_id in transaction_map:
+                if (ins_type == InstructionType.WRITE) or (ins_type == InstructionType.READ and inst.type == InstructionType.WRITE):
+                    conflicting = inst.t_id
+        return conflicting
 
     def update_wait_for_graph(self, t_id, conflicting_t_id):
         '''Updates the wait_for_graph to add an edge from t_id to conflicting_t_id
@@ -245,10 +670,14 @@ class TransactionManager:
             t_id(string): transaction id of the instruction
             conflicting_t_id(string): transaction id of the conflicting instruction
         SideEffect:
-            Add an edge from t_id to conflicting_t_id in the wait_for_graph
+            Add an edge from t_id to conflicting_t_id in the wait_for_graph. When deadlocks are prevented,
+            also records that t_id waits for another transaction
         '''            
-        if not self.transaction_map[t_id].read_only:
-            self.wait_for_graph[t_id].add(conflicting_t_id)
+        if self.transaction_map[t_id].read_only:
+            return
+        self.wait_for_graph.add_edges(t_id, (conflicting_t_id,))
+        if self.deadlock_prevention is not None:
+            self.lock_waiters.add(t_id)
 
     def update_wait_for_graph_with_executing_transaction(self, t_id, var):
         '''Updates the wait_for_graph to add an edge from t_id to all other transaction that has lock on the variable, var
@@ -257,12 +686,27 @@ class TransactionManager:
             t_id(string): transaction id of the instruction
             var(string): variable name
         SideEffect:
-            Add an edge from t_id to to all other transaction that has lock on the variable, var
+            Add an edge from t_id to to all other transaction that has lock on the variable, var. When deadlocks
+            are prevented, also records that t_id waits for another transaction, if one holds a lock on var
         '''           
-        if not self.transaction_map[t_id].read_only:
-            t_ids = self.site_manager.get_locking_transaction(var)
-            t_ids.discard(t_id)
-            self.wait_for_graph[t_id].update(t_ids)
+        if self.transaction_map[t_id].read_only:
+            return
+        t_ids = self.site_manager.get_locking_transaction(var)
+        t_ids.discard(t_id)
+        self.wait_for_graph.add_edges(t_id, t_ids)
+        if self.deadlock_prevention is not None and t_ids:
+            self.lock_waiters.add(t_id)
+
+    def waits_for_transaction(self, t_id):
+        '''Returns True if the blocked instruction of t_id waits for another transaction, False if it only
+        waits for failed sites to recover
+        Parameters:
+            self(TransactionManager): instance of the class. 
+            t_id(string): transaction id of a queued instruction
+        '''
+        if self.deadlock_prevention is None:
+            return len(self.wait_for_graph.waits_for(t_id)) > 0
+        return t_id in self.lock_waiters
 
     def remove_transaction_from_wait_for_graph(self, t_id):
         '''Removes the transaction t_id from the wait_for_graph.
@@ -270,34 +714,10 @@ class TransactionManager:
             self(TransactionManager): instance of the class. 
             t_id(string): transaction id of the instruction
         SideEffect:
-            Removes the transaction t_id from each transactions values and remove the t_id from the wait_for_graph.
+            Removes the edges to and from t_id, and the t_id from the wait_for_graph.
         '''         
-        for t_ids in self.wait_for_graph.values():
-            t_ids.discard(t_id)
-        if t_id in self.wait_for_graph:
-            self.wait_for_graph.pop(t_id)
-
-    def is_deadlocked(self, t_id, vis, rec_vis):
-        '''Check if the current state of wait-for-graph contains a cycle
-        Parameters:
-            self(TransactionManager): instance of the class. 
-            t_id(string): transaction id of the instruction
-            vis(set): set of nodes already visited
-            rec_vis(set): set of nodes visited in current recursion
-        Returns:
-            True if the wait_for_graph contains cycle otherwise False
-        '''          
-        if t_id in rec_vis:
-            return True
-        if t_id in vis:
-            return False
-        vis.add(t_id)
-        rec_vis.add(t_id)
-        for v in self.wait_for_graph[t_id]:
-            if self.is_deadlocked(v, vis, rec_vis):
-                return True
-        rec_vis.discard(t_id)
-        return False
+        self.wait_for_graph.remove(t_id)
+        self.lock_waiters.discard(t_id)
 
     def detect_and_handle_deadlock(self, t_id):
         '''Check if the current state of wait-for-graph leads to deadlock
@@ -305,13 +725,72 @@ class TransactionManager:
             self(TransactionManager): instance of the class. 
             t_id(string): transaction id of the instruction
         SideEffect:
-            If deadlock if found Aborts the youngest transaction in the wait_for_graph cycle.
+            If deadlock if found Aborts the youngest transaction in the wait_for_graph cycle, until no cycle
+            is left from t_id. Only edges added to t_id since its last check can close a new cycle, otherwise the check is skipped.
         '''         
-        rec_vis = set()
-        if self.is_deadlocked(t_id, set(), rec_vis):
+        metrics = self.metrics
+        if metrics is not None and t_id in self.wait_for_graph.unchecked:
+            metrics.inc('deadlock_checks_total')
+            metrics.observe('wait_for_graph_size', len(self.wait_for_graph.edges), SIZE_BUCKETS)
+            start = clock.perf_counter()
+            rec_vis = self.wait_for_graph.find_cycle(t_id)
+            metrics.observe('deadlock_check_seconds', clock.perf_counter() - start, SECOND_BUCKETS)
+        else:
+            rec_vis = self.wait_for_graph.find_cycle(t_id)
+        while rec_vis is not None:
             y_tid, time = self.find_youngest_transaction(rec_vis)
-            print(f'Aborting transaction :{y_tid} because of deadlock')
+            self.output.emit('deadlock', y_tid)
+            if metrics is not None:
+                metrics.inc('aborts_total', (('reason', 'deadlock'),))
             self.abort(y_tid, time)
+            # t_id may be on another cycle still, which no later retry of its instruction would find
+            rec_vis = self.wait_for_graph.find_cycle(t_id)
+
+    def prevent_deadlock(self, t_id, var, conflicting_transaction, time):
+        '''Applies the wait-die or wound-wait rule to the blocked instruction of t_id on var, instead of
+        detecting deadlocks on the wait-for graph
+        Parameters:
+            self(TransactionManager): instance of the class. 
+            t_id(string): transaction id of the blocked instruction
+            var(string): variable name
+            conflicting_transaction(string): transaction id of the queued instruction t_id waits behind,
+                None if it waits for the locks on var
+            time(int): time of instruction
+        SideEffect:
+            wait-die aborts t_id if it would wait for an older transaction. wound-wait aborts the younger
+            transactions t_id would wait for. Waits then only go from older to younger transactions, or from
+            younger to older ones, so they can never form a cycle
+        '''
+        transaction = self.transaction_map.get(t_id)
+        if transaction is None or transaction.read_only or transaction.status != TransactionStatus.BLOCKED:
+            return
+        if conflicting_transaction is not None:
+            t_ids = {conflicting_transaction}
+        else:
+            t_ids = self.site_manager.get_locking_transaction(var)
+            t_ids.discard(t_id)
+        age = (transaction.start_time, t_id)
+        younger = []
+        older = False
+        for other_t_id in t_ids:
+            other = self.transaction_map.get(other_t_id)
+            if other is None:
+                continue
+            if (other.start_time, other_t_id) > age:
+                younger.append(other)
+            else:
+                older = True
+        if self.deadlock_prevention == 'wait-die':
+            victims = [transaction] if older else []
+        else:
+            victims = sorted(younger, key=lambda other: (other.start_time, other.id))
+        for victim in victims:
+            if victim.id not in self.transaction_map:
+                continue # ended by the abort of a previous victim
+            self.output.emit('prevention', victim.id, self.deadlock_prevention)
+            if self.metrics is not None:
+                self.metrics.inc('aborts_total', (('reason', self.deadlock_prevention.replace('-', '_')),))
+            self.abort(victim.id, time)
 
     def find_youngest_transaction(self, rec_vis):
         '''find the youngest transaction in the wait_for_graph cycle.
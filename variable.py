@@ -1,22 +1,26 @@
+from version_store import VersionStore
+
+
 class Variable:
     '''Data Model for the Variable'''
-    def __init__(self, name, val, lock, replicated = False):
+    __slots__ = ('name', 'val', 'commited_value', 'commited_time', 'replicated', 'readable_epoch', 'version_history')
+
+    def __init__(self, name, val, replicated = False, time = 0):
         '''creates and initialises a new variable
 
         Parameters:
         name(string): name of the variable
         val(int): value of the variable
-        lock(list): list of locks on the variable
         replicated(bool): True if variable is replicated across multiple sites
+        time(int): commit time of val
 
         Returns:
         Variable: a new variable object initialized with the given values
         '''
         self.name = name
         self.val = val
-        self.lock = lock
         self.commited_value = val
-        self.commited_time = 0
+        self.commited_time = time
         self.replicated = replicated
-        self.readable = True
-        self.version_history = {0:val} #dict of time and val
\ No newline at end of file
+        self.readable_epoch = 0 # epoch of the site at the last commit, see VariableTable.epoch
+        self.version_history = VersionStore(val, time) #committed values by commit time
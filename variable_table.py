@@ -0,0 +1,242 @@
+import bisect
+from variable import Variable
+
+
+def variable_index(var_name):
+    '''Returns j for the variable named xj, None for any other name'''
+    if var_name[:1] != 'x' or not var_name[1:].isdigit():
+        return None
+    return int(var_name[1:])
+
+
+class VariableTable:
+    '''Variables held by a Site. A variable is kept implicitly as its initial value 10*j, committed
+    at time 0, until it is first locked or written, when a Variable object is created for it.
+    With a store, implicit variables take their committed value and time from it instead, and
+    variables go back to implicit once their commit is stored'''
+    def __init__(self, indices, placement, store=None):
+        '''creates and initialises a new variable table
+
+        Parameters:
+        indices(array): ascending j of every variable xj held by the site
+        placement(dict): dictionary of var name and the list of names of the sites holding it
+        store(MmapStore): store of the committed values and times, None to keep them in memory
+
+        Returns:
+        VariableTable: a new table with no materialized variables
+        '''
+        self.indices = indices
+        self.placement = placement
+        self.store = store
+        self.records = {} # dict of var name and Variable, for the materialized variables
+        self.epoch = 0 # number of failures of the site. A replicated variable is readable if it was
+                       # committed since the last one, or if the site never failed
+
+    def position(self, var_name):
+        '''Returns the position of var_name in the indices of the site, None if the site does not hold it'''
+        j = variable_index(var_name)
+        if j is None:
+            return None
+        idx = bisect.bisect_left(self.indices, j)
+        if idx < len(self.indices) and self.indices[idx] == j:
+            return idx
+        return None
+
+    def __contains__(self, var_name):
+        return self.position(var_name) is not None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, var_name):
+        '''Returns the Variable object of var_name, creating it on first access'''
+        variable = self.records.get(var_name)
+        if variable is None:
+            idx = self.position(var_name)
+            if idx is None:
+                raise KeyError(var_name)
+            replicated = self.is_replicated(var_name)
+            if self.store is not None:
+                variable = Variable(var_name, self.store.value(idx), replicated, self.store.time(idx))
+            else:
+                variable = Variable(var_name, 10*self.indices[idx], replicated)
+            self.records[var_name] = variable
+        return variable
+
+    def get(self, var_name):
+        '''Returns the Variable object of var_name if it was materialized, otherwise None'''
+        return self.records.get(var_name)
+
+    def is_replicated(self, var_name):
+        return len(self.placement[var_name]) > 1
+
+    def is_readable(self, var_name):
+        '''Returns True if var_name can be read at this site, without materializing it'''
+        variable = self.records.get(var_name)
+        if variable is not None:
+            return not variable.replicated or variable.readable_epoch == self.epoch
+        return self.epoch == 0 or not self.is_replicated(var_name)
+
+    def read_at(self, var_name, time):
+        '''Returns the latest value of var_name committed before time, without materializing it'''
+        variable = self.records.get(var_name)
+        if variable is not None:
+            return variable.version_history.read_at(time)
+        if self.store is not None:
+            return self.store.value(self.position(var_name))
+        return 10*variable_index(var_name)
+
+    def read_many_at(self, var_names, time):
+        '''Returns the latest value of each of var_names committed before time, without materializing them
+
+        Parameters:
+            self(VariableTable): instance of the class
+            var_names(list): names of the variables, read in a single pass over the table when in variable order
+            time(int): snapshot time
+        Returns:
+            list: the value of each variable, None for the ones not readable or not held at this site
+        '''
+        records = self.records
+        store = self.store
+        indices = self.indices
+        epoch = self.epoch
+        values = []
+        lo = 0
+        last = 0
+        for var_name in var_names:
+            variable = records.get(var_name)
+            if variable is not None:
+                readable = not variable.replicated or variable.readable_epoch == epoch
+                values.append(variable.version_history.read_at(time) if readable else None)
+                continue
+            j = variable_index(var_name)
+            if j is None:
+                values.append(None)
+                continue
+            if j < last:
+                lo = 0
+            last = j
+            idx = bisect.bisect_left(indices, j, lo)
+            if idx == len(indices) or indices[idx] != j:
+                values.append(None)
+                continue
+            lo = idx
+            if epoch != 0 and self.is_replicated(var_name):
+                values.append(None)
+            elif store is not None:
+                values.append(store.value(idx))
+            else:
+                values.append(10*j)
+        return values
+
+    def mark_replicated_unreadable(self):
+        '''Makes every replicated variable unreadable, as after a failure of the site, by starting a new epoch'''
+        self.epoch += 1
+
+    def mark_readable(self, variable):
+        '''Makes variable readable again, as after a commit'''
+        variable.readable_epoch = self.epoch
+
+    def committed_items(self):
+        '''Returns pairs of var name and committed value for every variable, in variable order'''
+        records = self.records
+        store = self.store
+        for idx, j in enumerate(self.indices):
+            var_name = 'x'+str(j)
+            variable = records.get(var_name)
+            if variable is not None:
+                yield (var_name, variable.commited_value)
+            elif store is not None:
+                yield (var_name, store.value(idx))
+            else:
+                yield (var_name, 10*j)
+
+    def persist(self, variable):
+        '''Writes the committed value of a variable to the store, and drops its Variable object
+        if the store and the implicit readability now describe it fully
+
+        Parameters:
+            self(VariableTable): instance of the class
+            variable(Variable): variable without locks, just committed
+        SideEffect:
+            Values that do not fit a slot of the store keep their Variable object
+        '''
+        store = self.store
+        if not store.fits(variable.commited_value):
+            return
+        store.set(self.position(variable.name), variable.commited_value, variable.commited_time)
+        if (len(variable.version_history) == 1 and variable.val == variable.commited_value
+                and (not variable.replicated or (variable.readable_epoch == self.epoch) == (self.epoch == 0))):
+            del self.records[variable.name]
+
+    def version_items(self):
+        '''Returns pairs of var name and list of (commit time, value) of the retained versions of
+        every variable committed after time 0, including those only held by the store'''
+        for var_name, variable in self.records.items():
+            if variable.commited_time != 0 or len(variable.version_history) > 1:
+                yield (var_name, list(variable.version_history.items()))
+        store = self.store
+        if store is not None:
+            for idx, j in enumerate(self.indices):
+                var_name = 'x' + str(j)
+                if store.time(idx) != 0 and var_name not in self.records:
+                    yield (var_name, [(store.time(idx), store.value(idx))])
+
+    def versions_of(self, var_name):
+        '''Returns the retained versions of var_name as a list of (commit time, value), without materializing it'''
+        variable = self.records.get(var_name)
+        if variable is not None:
+            return list(variable.version_history.items())
+        if self.store is not None:
+            idx = self.position(var_name)
+            return [(self.store.time(idx), self.store.value(idx))]
+        return [(0, 10*variable_index(var_name))]
+
+    def unreadable_replicated(self, position, limit):
+        '''Finds the replicated variables that are not readable, as after a failure of the site
+
+        Parameters:
+            self(VariableTable): instance of the class
+            position(int): position in the variables of the site to start from
+            limit(int): number of variables to check
+        Returns:
+            tuple: the list of names found, in variable order, and the position to continue from,
+            len(self) once every variable was checked
+        '''
+        names = []
+        end = min(position + limit, len(self.indices))
+        for idx in range(position, end):
+            var_name = 'x'+str(self.indices[idx])
+            if self.is_replicated(var_name) and not self.is_readable(var_name):
+                names.append(var_name)
+        return (names, end)
+
+    def restore(self, versions, low_watermark):
+        '''Replaces the variables by the committed versions read from the log of the site
+
+        Parameters:
+            self(VariableTable): instance of the class
+            versions(dict): dictionary of var name and list of (commit time, value) in commit time order
+            low_watermark(int): start time of the oldest active read-only transaction, None if there is none
+        SideEffect:
+            Variables without versions are back to their initial value, and the readability of the
+            replicated ones is kept
+        '''
+        self.records = {}
+        for var_name, items in versions.items():
+            if var_name not in self:
+                continue
+            variable = self[var_name]
+            for time, val in items:
+                variable.version_history.append(time, val)
+            variable.version_history.collect(low_watermark)
+            time, val = items[-1]
+            variable.val = variable.commited_value = val
+            variable.commited_time = time
+            if self.store is not None:
+                self.persist(variable)
+
+    def values(self):
+        '''Returns the Variable objects of every variable, materializing them'''
+        for j in self.indices:
+            yield self['x'+str(j)]
@@ -0,0 +1,78 @@
+import bisect
+
+
+class VersionStore:
+    '''Committed versions of a variable, kept in commit time order'''
+    __slots__ = ('times', 'values')
+
+    def __init__(self, val, time=0):
+        '''creates and initialises a new version store holding the initial value
+
+        Parameters:
+        val(int): value of the variable at time, time
+        time(int): commit time of val
+
+        Returns:
+        VersionStore: a new version store with a single version
+        '''
+        self.times = [time] # commit times, ascending
+        self.values = [val] # committed value at the same index
+
+    def __len__(self):
+        '''Returns the number of versions kept'''
+        return len(self.times)
+
+    def append(self, time, val):
+        '''Adds the value committed at time, time
+
+        Parameters:
+            self(VersionStore): instance of the class
+            time(int): commit time
+            val(int): committed value
+        '''
+        if time > self.times[-1]:
+            self.times.append(time)
+            self.values.append(val)
+        elif time == self.times[-1]:
+            self.values[-1] = val
+        else:
+            idx = bisect.bisect_left(self.times, time)
+            if self.times[idx] == time:
+                self.values[idx] = val
+            else:
+                self.times.insert(idx, time)
+                self.values.insert(idx, val)
+
+    def read_at(self, time):
+        '''Returns the latest value committed before time, time
+
+        Parameters:
+            self(VersionStore): instance of the class
+            time(int): snapshot time
+        Returns:
+            int: the committed value visible at the snapshot
+        '''
+        idx = bisect.bisect_left(self.times, time)
+        return self.values[idx-1]
+
+    def collect(self, low_watermark):
+        '''Drops versions that no snapshot at or after low_watermark can read
+
+        Parameters:
+            self(VersionStore): instance of the class
+            low_watermark(int): start time of the oldest active read-only transaction,
+                None if there is none
+        SideEffect:
+            Keeps the newest version committed before low_watermark and every later one
+        '''
+        if low_watermark is None:
+            idx = len(self.times) - 1
+        else:
+            idx = bisect.bisect_left(self.times, low_watermark) - 1
+        if idx > 0:
+            del self.times[:idx]
+            del self.values[:idx]
+
+    def items(self):
+        '''Returns the retained versions as pairs of commit time and value'''
+        return zip(self.times, self.values)
@@ -0,0 +1,89 @@
+from collections import defaultdict
+
+
+class WaitForGraph:
+    '''Wait-for graph between transactions with incremental cycle detection'''
+    def __init__(self):
+        '''creates and initialises a new empty wait-for graph
+
+        Returns:
+        WaitForGraph: a new graph with no edges
+        '''
+        self.edges = defaultdict(set) # dict of t_id and set of t_ids it waits for
+        self.reverse_edges = defaultdict(set) # dict of t_id and set of t_ids waiting for it
+        self.unchecked = set() # t_ids with edges added since their last cycle check
+
+    def add_edges(self, t_id, t_ids):
+        '''Adds an edge from t_id to each transaction in t_ids
+
+        Parameters:
+            self(WaitForGraph): instance of the class
+            t_id(string): transaction id of the waiting transaction
+            t_ids(iterable): transaction ids that t_id waits for
+        SideEffect:
+            Marks t_id for a cycle check if any of the edges is new
+        '''
+        waits_for = self.edges[t_id]
+        for conflicting_t_id in t_ids:
+            if conflicting_t_id not in waits_for:
+                waits_for.add(conflicting_t_id)
+                self.reverse_edges[conflicting_t_id].add(t_id)
+                self.unchecked.add(t_id)
+
+    def waits_for(self, t_id):
+        '''Returns the transactions that t_id waits for
+
+        Parameters:
+            self(WaitForGraph): instance of the class
+            t_id(string): transaction id
+        Returns:
+            set: transaction ids that t_id waits for
+        '''
+        return self.edges.get(t_id, ())
+
+    def remove(self, t_id):
+        '''Removes t_id and all its edges from the graph, in time proportional to its degree
+
+        Parameters:
+            self(WaitForGraph): instance of the class
+            t_id(string): transaction id
+        '''
+        for conflicting_t_id in self.edges.pop(t_id, ()):
+            waiting = self.reverse_edges.get(conflicting_t_id)
+            if waiting is not None:
+                waiting.discard(t_id)
+        for waiting_t_id in self.reverse_edges.pop(t_id, ()):
+            self.edges[waiting_t_id].discard(t_id)
+        self.unchecked.discard(t_id)
+
+    def find_cycle(self, t_id):
+        '''Looks for a cycle reachable from t_id if edges were added to it since its last check
+
+        Iterative depth first search that visits nodes in the same order as a recursive one.
+
+        Parameters:
+            self(WaitForGraph): instance of the class
+            t_id(string): transaction id to start from
+        Returns:
+            set: the transactions on the search path that closes a cycle, or None if there is no cycle
+        '''
+        if t_id not in self.unchecked:
+            return None
+        vis = {t_id}
+        rec_vis = {t_id}
+        stack = [(t_id, iter(self.edges.get(t_id, ())))]
+        while stack:
+            node, neighbours = stack[-1]
+            for v in neighbours:
+                if v in rec_vis:
+                    return rec_vis
+                if v not in vis:
+                    vis.add(v)
+                    rec_vis.add(v)
+                    stack.append((v, iter(self.edges.get(v, ()))))
+                    break
+            else:
+                rec_vis.discard(node)
+                stack.pop()
+        self.unchecked.discard(t_id)
+        return None
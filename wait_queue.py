@@ -0,0 +1,224 @@
+import heapq
+from collections import defaultdict, deque
+from itertools import count
+from instruction_type import InstructionType
+
+
+class WaitQueues:
+    '''FIFO queues of blocked instructions, one per variable. The instructions of read-only and optimistic
+    transactions take no locks and only wait for failed sites, so they wait in lockless queues of their own,
+    which neither hold up the locking instructions nor are held up by them'''
+    def __init__(self):
+        '''creates and initialises empty wait queues
+
+        Returns:
+        WaitQueues: a new object with no blocked instructions
+        '''
+        self.queues = {} # dict of var name and deque of (arrival number, instruction) of the locking instructions
+        self.lockless = {} # dict of var name and deque of (arrival number, instruction) of the lockless instructions
+        self.writes = {} # dict of var name and deque of (arrival number, instruction) of the writes in its queue
+        # dict of t_id and dict of the arrival number of each of its queued instructions and (lockless, var name)
+        self.queued_vars = defaultdict(dict)
+        self.woken = set() # var names whose queues are retried in the next pass
+        self.rechecks = set() # t_ids whose queued instructions are retried in the next pass wherever they are
+        self.retrying = set() # arrival numbers of the instructions being retried, which nested passes skip
+        self.missed = set() # arrival numbers of the instructions being retried that a nested pass had to recheck
+        self.arrivals = count()
+
+    def enqueue(self, instruction, lockless=False):
+        '''Adds a blocked instruction at the tail of the queue of its variable
+
+        Parameters:
+            self(WaitQueues): instance of the class
+            instruction(Instruction): the blocked instruction
+            lockless(bool): True for an instruction of a read-only or optimistic transaction
+        '''
+        var = instruction.var
+        entry = (next(self.arrivals), instruction)
+        queues = self.lockless if lockless else self.queues
+        queue = queues.get(var)
+        if queue is None:
+            queue = queues[var] = deque()
+        queue.append(entry)
+        if not lockless and instruction.type == InstructionType.WRITE:
+            writes = self.writes.get(var)
+            if writes is None:
+                writes = self.writes[var] = deque()
+            writes.append(entry)
+        self.queued_vars[instruction.t_id][entry[0]] = (lockless, var)
+
+    def get_queue(self, var):
+        '''Returns the locking instructions waiting on var in arrival order
+
+        Parameters:
+            self(WaitQueues): instance of the class
+            var(string): name of the variable
+        Returns:
+            deque: pairs of arrival number and instruction
+        '''
+        return self.queues.get(var, ())
+
+    def get_writes(self, var):
+        '''Returns the writes waiting on var in arrival order, as pairs of arrival number and instruction'''
+        return self.writes.get(var, ())
+
+    def wake(self, var_names):
+        '''Marks the queues of the given variables to be retried in the next pass
+
+        Parameters:
+            self(WaitQueues): instance of the class
+            var_names(iterable): names of the variables
+        '''
+        self.woken.update(var_names)
+
+    def wake_transaction(self, t_id):
+        '''Marks the queues that hold instructions of t_id to be retried in the next pass
+
+        Parameters:
+            self(WaitQueues): instance of the class
+            t_id(string): transaction id
+        '''
+        self.woken.update(var for lockless, var in self.queued_vars.get(t_id, {}).values())
+
+    def recheck(self, t_id):
+        '''Marks the queued instructions of t_id to be retried in the next pass even if they are behind an
+        instruction still blocked, as the transaction they waited for ended
+
+        Parameters:
+            self(WaitQueues): instance of the class
+            t_id(string): transaction id
+        '''
+        if t_id in self.queued_vars:
+            self.rechecks.add(t_id)
+
+    def run_pass(self, retry):
+        '''Retries the woken queues and the instructions to recheck, in arrival order
+
+        Parameters:
+            self(WaitQueues): instance of the class
+            retry(callable): retries an instruction. Returns True if it left its queue, granted or dropped,
+                False if it is still blocked by another transaction and None if it is still blocked by
+                failed sites only
+        Returns:
+            tuple: the number of instructions retried and the number that left their queues
+        SideEffect:
+            A locking queue is retried up to its first instruction still blocked by another transaction,
+            as the ones behind it wait for it or for the same locks. A lockless queue is retried whole.
+            The instructions that left are removed, and the queues that lost one but still have waiters
+            are woken again. A retry may abort a transaction and run a nested pass, so the queues are
+            looked up again by arrival number after each retry, and the nested pass takes the instructions
+            still being retried as blocked, so that none is run twice at once, and the pass running one
+            retries it again if a nested pass had to recheck it
+        '''
+        woken = self.woken
+        self.woken = set()
+        rechecks = self.rechecks
+        self.rechecks = set()
+        heap = [] # (arrival number, lockless, var name, True to retry only this instruction)
+        for var in woken:
+            for lockless, queues in ((False, self.queues), (True, self.lockless)):
+                queue = queues.get(var)
+                if queue:
+                    heap.append((queue[0][0], lockless, var, False))
+        for t_id in rechecks:
+            for arrival, (lockless, var) in self.queued_vars.get(t_id, {}).items():
+                heap.append((arrival, lockless, var, True))
+        heapq.heapify(heap)
+        retried = 0
+        finished = 0
+        done = set() # arrival numbers retried in this pass
+        shortened = set() # var names whose queues lost an instruction
+        while heap:
+            arrival, lockless, var, single = heapq.heappop(heap)
+            queues = self.lockless if lockless else self.queues
+            queue = queues.get(var)
+            index = self.locate(queue, arrival)
+            if index is None or (single and queue[index][0] != arrival):
+                continue
+            arrival, instruction = queue[index]
+            if arrival in self.retrying:
+                if single:
+                    self.missed.add(arrival) # the running retry may have decided before the change
+                granted = False
+            elif arrival in done:
+                granted = None
+            else:
+                done.add(arrival)
+                retried += 1
+                self.retrying.add(arrival)
+                granted = retry(instruction)
+                self.retrying.discard(arrival)
+                if arrival in self.missed:
+                    self.missed.discard(arrival)
+                    if not granted:
+                        done.discard(arrival)
+                        heapq.heappush(heap, (arrival, lockless, var, True))
+            if granted:
+                finished += 1
+                queue = queues.get(var)
+                index = self.locate(queue, arrival)
+                if index is not None and queue[index][0] == arrival:
+                    self.remove_at(lockless, var, index)
+                    shortened.add(var)
+            elif granted is False and not lockless:
+                continue # the locking queue waits for this instruction
+            if single:
+                continue
+            queue = queues.get(var)
+            index = self.locate(queue, arrival + 1)
+            if index is not None:
+                heapq.heappush(heap, (queue[index][0], lockless, var, False))
+        for var in shortened:
+            if var in self.queues or var in self.lockless:
+                self.woken.add(var)
+        return (retried, finished)
+
+    def locate(self, queue, arrival):
+        '''Returns the index in queue of the first instruction that arrived at or after arrival, None if there
+        is none. The queues are in arrival order, so it is a binary search'''
+        if not queue:
+            return None
+        low, high = 0, len(queue)
+        while low < high:
+            middle = (low + high) // 2
+            if queue[middle][0] < arrival:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(queue) else None
+
+    def remove_at(self, lockless, var, index):
+        '''Removes the instruction at index in the queue of var, the front of the queue unless it is an
+        instruction rechecked behind a blocked one'''
+        queues = self.lockless if lockless else self.queues
+        queue = queues[var]
+        arrival, instruction = queue[index]
+        if index == 0:
+            queue.popleft()
+        else:
+            del queue[index]
+        if not queue:
+            del queues[var]
+        if not lockless and instruction.type == InstructionType.WRITE:
+            writes = self.writes[var]
+            if writes[0][0] == arrival:
+                writes.popleft()
+            else:
+                del writes[self.locate(writes, arrival)]
+            if not writes:
+                del self.writes[var]
+        queued = self.queued_vars[instruction.t_id]
+        del queued[arrival]
+        if not queued:
+            del self.queued_vars[instruction.t_id]
+
+    def remove_transaction(self, t_id):
+        '''Removes the instructions left in the queues by the transaction t_id, which ended
+
+        Parameters:
+            self(WaitQueues): instance of the class
+            t_id(string): transaction id
+        '''
+        for arrival, (lockless, var) in list(self.queued_vars.get(t_id, {}).items()):
+            queue = (self.lockless if lockless else self.queues)[var]
+            self.remove_at(lockless, var, self.locate(queue, arrival))
@@ -0,0 +1,164 @@
+import json
+import os
+
+
+class WriteAheadLog:
+    '''Settings of the write-ahead logs of the sites, one directory per site under directory'''
+    def __init__(self, directory, group_commit=1, checkpoint_every=1000, fsync=True):
+        '''creates and initialises the settings of the write-ahead logs
+
+        Parameters:
+        directory(string): directory holding the logs, created if missing
+        group_commit(int): number of commits written to a log before it is flushed and fsynced
+        checkpoint_every(int): number of commits at a site between two checkpoints
+        fsync(bool): False to only flush the logs to the operating system
+
+        Returns:
+        WriteAheadLog: the settings of the logs
+        '''
+        self.directory = directory
+        self.group_commit = group_commit
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+
+    def open(self, site_name):
+        '''Returns the SiteLog of the site site_name'''
+        return SiteLog(os.path.join(self.directory, 'site' + site_name), self.group_commit,
+            self.checkpoint_every, self.fsync)
+
+
+class SiteLog:
+    '''Append-only log of the writes committed at a Site, with periodic checkpoints.
+    The log holds one JSON array per line, ["W", var name, value] for each write of a commit
+    followed by ["C", time] once all of them are written'''
+    def __init__(self, directory, group_commit=1, checkpoint_every=1000, fsync=True):
+        '''opens the log in directory, creating it if missing
+
+        Parameters:
+        directory(string): directory of the log and checkpoint of the site
+        group_commit(int): number of commits written before the log is flushed and fsynced
+        checkpoint_every(int): number of commits between two checkpoints
+        fsync(bool): False to only flush the log to the operating system
+
+        Returns:
+        SiteLog: the log, positioned at its end
+        '''
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, 'wal.log')
+        self.checkpoint_path = os.path.join(directory, 'checkpoint.json')
+        self.group_commit = group_commit
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        self.truncate_incomplete()
+        self.file = open(self.log_path, 'a')
+        self.unsynced = 0 # commits written since the last sync
+        self.since_checkpoint = 0 # commits written since the last checkpoint
+
+    def truncate_incomplete(self):
+        '''Cuts the log after its last commit record, dropping the writes of a commit interrupted by a crash'''
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb+') as f:
+            end = 0
+            pos = 0
+            for line in f:
+                pos += len(line)
+                if line.startswith(b'["C"') and line.endswith(b'\n'):
+                    end = pos
+            f.truncate(end)
+
+    def append(self, var_name, val):
+        '''Writes the committed value val of var_name, to be followed by commit'''
+        self.file.write(json.dumps(['W', var_name, val]) + '\n')
+
+    def commit(self, time, defer_sync=False):
+        '''Marks the writes appended since the last commit as committed at time, time
+
+        Parameters:
+            self(SiteLog): instance of the class
+            time(int): commit time
+            defer_sync(bool): True to leave the sync to sync_if_due, once the whole group is written
+        SideEffect:
+            Syncs the log once group_commit commits are written since the last sync
+        '''
+        self.file.write(json.dumps(['C', time]) + '\n')
+        self.unsynced += 1
+        self.since_checkpoint += 1
+        if not defer_sync:
+            self.sync_if_due()
+
+    def sync_if_due(self):
+        '''Syncs the log if group_commit commits are written since the last sync'''
+        if self.unsynced >= self.group_commit:
+            self.sync()
+
+    def sync(self):
+        '''Flushes the log and fsyncs it'''
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def should_checkpoint(self):
+        return self.since_checkpoint >= self.checkpoint_every
+
+    def checkpoint(self, versions):
+        '''Writes a checkpoint of the committed versions and starts a new empty log
+
+        Parameters:
+            self(SiteLog): instance of the class
+            versions(iterable): pairs of var name and list of (commit time, value) of its retained versions
+        SideEffect:
+            The checkpoint is replaced atomically, so a crash leaves either the old or the new one
+        '''
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({var_name: items for var_name, items in versions}, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self.file.close()
+        self.file = open(self.log_path, 'w')
+        self.unsynced = 0
+        self.since_checkpoint = 0
+
+    def load(self):
+        '''Reads the last checkpoint and replays the committed writes logged after it
+
+        Parameters:
+            self(SiteLog): instance of the class
+        Returns:
+            dict: dictionary of var name and list of (commit time, value) in commit time order.
+            Writes without their commit record, as left by a crash, are ignored
+        '''
+        self.sync()
+        versions = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                for var_name, items in json.load(f).items():
+                    versions[var_name] = [tuple(item) for item in items]
+        with open(self.log_path) as f:
+            pending = []
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break # torn write at the end of the log
+                if record[0] == 'W':
+                    pending.append((record[1], record[2]))
+                else:
+                    time = record[1]
+                    for var_name, val in pending:
+                        items = versions.setdefault(var_name, [])
+                        if items and items[-1][0] == time:
+                            items[-1] = (time, val)
+                        else:
+                            items.append((time, val))
+                    pending = []
+        return versions
+
+    def close(self):
+        '''Syncs and closes the log'''
+        self.sync()
+        self.file.close()
@@ -0,0 +1,159 @@
+import argparse
+import bisect
+import itertools
+import random
+import sys
+from trans_status import TransactionStatus
+
+
+class WorkloadGenerator:
+    '''Seeded generator of synthetic workloads in the input grammar of the driver'''
+    def __init__(self, num_transactions=1000, concurrency=8, read_ratio=0.5, read_only_fraction=0.1,
+            zipf_skew=0.0, transaction_length=4, fail_rate=0.0, recover_rate=0.1,
+            num_site=10, num_var=20, seed=0):
+        '''creates and initialises a new workload generator
+
+        Parameters:
+        num_transactions(int): number of transactions to begin
+        concurrency(int): number of transactions running at the same time
+        read_ratio(float): fraction of the operations of read-write transactions that are reads
+        read_only_fraction(float): fraction of the transactions that are read-only
+        zipf_skew(float): exponent s of the Zipfian choice of variables, P(xj) ~ 1/j^s, 0 is uniform
+        transaction_length(int): number of reads and writes of each transaction
+        fail_rate(float): probability that a site fails after each operation
+        recover_rate(float): probability that a failed site recovers after each operation
+        num_site(int): number of sites
+        num_var(int): number of variables
+        seed(int): seed of the random number generator
+
+        Returns:
+        WorkloadGenerator: a new generator
+        '''
+        self.num_transactions = num_transactions
+        self.concurrency = concurrency
+        self.read_ratio = read_ratio
+        self.read_only_fraction = read_only_fraction
+        self.transaction_length = transaction_length
+        self.fail_rate = fail_rate
+        self.recover_rate = recover_rate
+        self.num_site = num_site
+        self.var_names = ['x'+str(j) for j in range(1, num_var+1)]
+        self.cum_weights = list(itertools.accumulate(1 / j**zipf_skew for j in range(1, num_var+1)))
+        self.seed = seed
+
+    def choose_var(self, rng):
+        '''Returns a variable name drawn from the Zipfian distribution'''
+        idx = bisect.bisect_right(self.cum_weights, rng.random() * self.cum_weights[-1])
+        return self.var_names[min(idx, len(self.var_names) - 1)]
+
+    def transaction(self, rng, t_id):
+        '''Returns the lines of a whole transaction t_id, from its begin to its end, for a single client
+
+        Parameters:
+            self(WorkloadGenerator): instance of the class
+            rng(Random): random number generator of the client
+            t_id(string): transaction id
+        Returns:
+            list: lines of the input, without the trailing newline
+        '''
+        read_only = rng.random() < self.read_only_fraction
+        lines = [('beginRO(' if read_only else 'begin(') + t_id + ')']
+        for _ in range(self.transaction_length):
+            var = self.choose_var(rng)
+            if read_only or rng.random() < self.read_ratio:
+                lines.append('R(' + t_id + ',' + var + ')')
+            else:
+                lines.append('W(' + t_id + ',' + var + ',' + str(rng.randrange(1000)) + ')')
+        lines.append('end(' + t_id + ')')
+        return lines
+
+    def generate(self, status=None):
+        '''Generates the workload. The same seed always yields the same lines
+
+        Parameters:
+            self(WorkloadGenerator): instance of the class
+            status(function): if given, called with a t_id to get the TransactionStatus of a running
+                transaction, or None once it was aborted. Blocked transactions then issue no operations
+                until they are granted, as clients waiting for a reply would, and aborted ones stop
+        Returns:
+            generator: lines of the input, without the trailing newline
+        '''
+        rng = random.Random(self.seed)
+        active = [] # list of [t_id, read_only, remaining operations] of running transactions
+        failed = [] # names of the failed sites
+        started = 0
+        while started < self.num_transactions or active:
+            while started < self.num_transactions and len(active) < self.concurrency:
+                started += 1
+                t_id = 'T'+str(started)
+                read_only = rng.random() < self.read_only_fraction
+                active.append([t_id, read_only, self.transaction_length])
+                yield ('beginRO(' if read_only else 'begin(') + t_id + ')'
+            if status is not None:
+                ready = []
+                for entry in list(active):
+                    current = status(entry[0])
+                    if current is None:
+                        active.remove(entry)
+                    elif current != TransactionStatus.BLOCKED:
+                        ready.append(entry)
+                if not active:
+                    continue
+                if not ready:
+                    if failed: # only blocked on failed sites
+                        yield 'recover(' + failed.pop(rng.randrange(len(failed))) + ')'
+                        continue
+                    ready = active
+            else:
+                ready = active
+            entry = ready[rng.randrange(len(ready))]
+            t_id, read_only, remaining = entry
+            if remaining == 0:
+                active.remove(entry)
+                yield 'end(' + t_id + ')'
+                continue
+            entry[2] = remaining - 1
+            var = self.choose_var(rng)
+            if read_only or rng.random() < self.read_ratio:
+                yield 'R(' + t_id + ',' + var + ')'
+            else:
+                yield 'W(' + t_id + ',' + var + ',' + str(rng.randrange(1000)) + ')'
+            if failed and rng.random() < self.recover_rate:
+                yield 'recover(' + failed.pop(rng.randrange(len(failed))) + ')'
+            if len(failed) < self.num_site and rng.random() < self.fail_rate:
+                site = rng.choice([str(i) for i in range(1, self.num_site+1) if str(i) not in failed])
+                failed.append(site)
+                yield 'fail(' + site + ')'
+        for site in failed:
+            yield 'recover(' + site + ')'
+        yield 'dump()'
+
+def add_arguments(parser):
+    '''Adds the options of the workload generator to parser'''
+    parser.add_argument('--transactions', type=int, default=1000, help='number of transactions')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent transactions')
+    parser.add_argument('--read-ratio', type=float, default=0.5, help='fraction of reads in read-write transactions')
+    parser.add_argument('--read-only', type=float, default=0.1, help='fraction of read-only transactions')
+    parser.add_argument('--skew', type=float, default=0.0, help='Zipfian skew of the variable choice, 0 is uniform')
+    parser.add_argument('--length', type=int, default=4, help='number of operations per transaction')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='probability of a site failure per operation')
+    parser.add_argument('--recover-rate', type=float, default=0.1, help='probability of a site recovery per operation')
+    parser.add_argument('--sites', type=int, default=10, help='number of sites')
+    parser.add_argument('--variables', type=int, default=20, help='number of variables')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator')
+
+def from_arguments(options):
+    '''Returns the WorkloadGenerator described by the options added by add_arguments'''
+    return WorkloadGenerator(options.transactions, options.concurrency, options.read_ratio,
+        options.read_only, options.skew, options.length, options.fail_rate, options.recover_rate,
+        options.sites, options.variables, options.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description='Writes a synthetic workload in the input grammar of the driver')
+    add_arguments(parser)
+    options = parser.parse_args()
+    for line in from_arguments(options).generate():
+        sys.stdout.write(line + '\n')
+
+if __name__ == '__main__':
+    main()